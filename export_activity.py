@@ -0,0 +1,27 @@
+import argparse
+
+from src.configuration import ACTIVITY_EXPORT_PATH
+from src.db.activity_export import ActivityExporter, PARQUET_FORMAT, NPZ_FORMAT, NPY_FORMAT, DAY_PARTITION_FORMAT
+from src.db.mongo_worker import MongoWorker
+from src.utils import Utils
+
+
+def parse_day(day_string: str):
+    return Utils.get_date_truncated_from_string(day_string, DAY_PARTITION_FORMAT)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export followers activity history into columnar files "
+                                                 "partitioned by day. Without dates only new days are exported.")
+    parser.add_argument("--start", type=parse_day, help="First exported day (YYYY-MM-DD).")
+    parser.add_argument("--end", type=parse_day, help="Day after the last exported one (YYYY-MM-DD).")
+    parser.add_argument("--followers", type=int, nargs="+",
+                        help="Ids of followers whose activity is exported (into a separate subdirectory of the path).")
+    parser.add_argument("--format", choices=[PARQUET_FORMAT, NPZ_FORMAT, NPY_FORMAT],
+                        help="Parquet by default (NPZ in case pyarrow is not installed).")
+    parser.add_argument("--path", default=ACTIVITY_EXPORT_PATH, help="Export directory.")
+    parser.add_argument("--overwrite", action="store_true", help="Export again already exported days.")
+    args = parser.parse_args()
+
+    exporter = ActivityExporter(MongoWorker(), args.path, args.format, follower_ids=args.followers)
+    exporter.export(args.start, args.end, args.overwrite)
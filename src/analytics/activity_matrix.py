@@ -0,0 +1,245 @@
+import datetime
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.configuration import MINUTES_INTERVALS_NUMBER, MINUTES_INTERVAL
+from src.db.activity_export import ActivityExporter, load_exported_day
+from src.db.constants import *
+from src.utils import Utils
+
+JACCARD_SIMILARITY = "jaccard"
+CORRELATION_SIMILARITY = "correlation"
+
+# Amount of interval columns multiplied at once while computing pairwise similarity. Limits memory used by the
+# float copy of the matrix to (followers number x chunk size).
+SIMILARITY_COLUMNS_CHUNK_SIZE = 4096
+
+WEEKDAYS_NUMBER = 7
+
+# Exported columns the matrix is built from.
+ACTIVITY_MATRIX_COLUMNS = [ID_KEY, MINUTES_INTERVAL_NUMBER_KEY, ONLINE_KEY, INFERRED_KEY]
+
+
+@dataclass
+class FollowerNeighbours:
+    follower_id: int
+    neighbour_ids: List[int]
+    similarities: List[float]
+
+
+@dataclass
+class ActivitySlot:
+    minutes_interval_number: int
+    # Average amount of followers online in the slot.
+    average_online: float
+
+    def get_time_string(self) -> str:
+        minutes = self.minutes_interval_number * MINUTES_INTERVAL
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class ActivityMatrix:
+    """Followers activity over a range of days as boolean matrices of shape (followers, days, intervals):
+       * `online[f, d, i]` is True if follower `f` was online in interval `i` of day `d`;
+       * `observed[f, d, i]` is True if activity of follower `f` was requested from Vk API in that interval
+         (inferred statuses are not considered observed).
+       Rows are ordered as `follower_ids`, days start from `start`."""
+
+    def __init__(self, follower_ids: np.ndarray, start: datetime.datetime, online: np.ndarray, observed: np.ndarray):
+        self.follower_ids = follower_ids
+        self.start = start
+        self.online = online
+        self.observed = observed
+        self.follower_index = {int(follower_id): index for index, follower_id in enumerate(follower_ids)}
+
+    @property
+    def days_number(self) -> int:
+        return self.online.shape[1]
+
+    @staticmethod
+    def create_empty(follower_ids: Iterable[int], start: datetime.datetime, days_number: int) -> "ActivityMatrix":
+        """Matrix of `follower_ids` (sorted) without any activity observed."""
+        follower_ids = np.unique(np.asarray(list(follower_ids), dtype=np.int64))
+        shape = (len(follower_ids), days_number, MINUTES_INTERVALS_NUMBER)
+        return ActivityMatrix(follower_ids, start, np.zeros(shape, dtype=bool), np.zeros(shape, dtype=bool))
+
+    def fill_day(self, day: datetime.datetime, columns: Dict[str, np.ndarray]):
+        """Mark activity of the day given as columns in the format of `ActivityExporter`."""
+        day_index = (day - self.start).days
+        if not 0 <= day_index < self.days_number or len(columns[ID_KEY]) == 0 or len(self.follower_ids) == 0:
+            return
+        rows = np.searchsorted(self.follower_ids, columns[ID_KEY])
+        # Skip followers that are not in `follower_ids`.
+        known = (rows < len(self.follower_ids)) & (self.follower_ids[np.minimum(rows, len(self.follower_ids) - 1)] ==
+                                                   columns[ID_KEY])
+        if INFERRED_KEY in columns:
+            known &= ~np.asarray(columns[INFERRED_KEY], dtype=bool)
+        rows = rows[known]
+        intervals = np.asarray(columns[MINUTES_INTERVAL_NUMBER_KEY][known], dtype=np.int64)
+        self.observed[rows, day_index, intervals] = True
+        self.online[rows, day_index, intervals] = np.asarray(columns[ONLINE_KEY][known], dtype=bool)
+
+    @staticmethod
+    def from_columns(
+            columns_by_day: Dict[datetime.datetime, Dict[str, np.ndarray]],
+            start: datetime.datetime,
+            days_number: int,
+            follower_ids: Optional[Iterable[int]] = None
+    ) -> "ActivityMatrix":
+        """Build the matrix from day columns in the format of `ActivityExporter`."""
+        if follower_ids is None:
+            all_ids = [columns[ID_KEY] for columns in columns_by_day.values()]
+            follower_ids = np.unique(np.concatenate(all_ids)) if all_ids else np.empty(0, np.int64)
+        activity_matrix = ActivityMatrix.create_empty(follower_ids, start, days_number)
+        for day, columns in columns_by_day.items():
+            activity_matrix.fill_day(day, columns)
+        return activity_matrix
+
+    @staticmethod
+    def from_export(
+            exporter: ActivityExporter,
+            start: datetime.datetime,
+            end: datetime.datetime,
+            follower_ids: Optional[Iterable[int]] = None
+    ) -> "ActivityMatrix":
+        """Load days in [`start`, `end`) exported by `exporter`. Days that weren't exported are left unobserved.
+           Days are read one by one, so that only the matrix and one day of activity are kept in memory."""
+        start = Utils.get_date_truncated_by_day(start)
+        end = Utils.get_date_truncated_by_day(end)
+        day_paths = {day: exporter.get_day_path(day) for day in exporter.get_exported_days() if start <= day < end}
+        if follower_ids is None:
+            all_ids = [load_exported_day(day_path, columns=[ID_KEY])[ID_KEY] for day_path in day_paths.values()]
+            follower_ids = np.unique(np.concatenate(all_ids)) if all_ids else np.empty(0, np.int64)
+        activity_matrix = ActivityMatrix.create_empty(follower_ids, start, (end - start).days)
+        for day, day_path in day_paths.items():
+            activity_matrix.fill_day(day, load_exported_day(day_path, columns=ACTIVITY_MATRIX_COLUMNS))
+        return activity_matrix
+
+    @staticmethod
+    def from_storage(
+            mongo_worker,
+            start: datetime.datetime,
+            end: datetime.datetime,
+            follower_ids: Optional[List[int]] = None
+    ) -> "ActivityMatrix":
+        """Load days in [`start`, `end`) directly from `activity_data` collection."""
+        start = Utils.get_date_truncated_by_day(start)
+        end = Utils.get_date_truncated_by_day(end)
+        ids, day_indices, intervals, online_values = [], [], [], []
+        for activity in mongo_worker.iterate_activities(start, end, follower_ids):
+            if activity.get(INFERRED_KEY, False):
+                continue
+            ids.append(activity[ID_KEY])
+            day_indices.append((activity[DATETIME_KEY] - start).days)
+            intervals.append(activity[MINUTES_INTERVAL_NUMBER_KEY])
+            online_values.append(bool(activity[ONLINE_KEY]))
+
+        days_number = (end - start).days
+        ids = np.asarray(ids, dtype=np.int64)
+        day_indices = np.asarray(day_indices, dtype=np.int64)
+        columns_by_day = dict()
+        for day_index in np.unique(day_indices):
+            day_mask = day_indices == day_index
+            columns_by_day[start + datetime.timedelta(days=int(day_index))] = {
+                ID_KEY: ids[day_mask],
+                MINUTES_INTERVAL_NUMBER_KEY: np.asarray(intervals, dtype=np.int64)[day_mask],
+                ONLINE_KEY: np.asarray(online_values, dtype=bool)[day_mask],
+            }
+        return ActivityMatrix.from_columns(columns_by_day, start, days_number, follower_ids)
+
+    def pack(self) -> Dict[str, np.ndarray]:
+        """Bit-packed representation of the matrix (8 intervals per byte) for storing or sending."""
+        return {
+            ID_KEY: self.follower_ids,
+            ONLINE_KEY: np.packbits(self.online, axis=-1),
+            "observed": np.packbits(self.observed, axis=-1),
+        }
+
+    @staticmethod
+    def unpack(packed: Dict[str, np.ndarray], start: datetime.datetime) -> "ActivityMatrix":
+        online = np.unpackbits(packed[ONLINE_KEY], axis=-1, count=MINUTES_INTERVALS_NUMBER).astype(bool)
+        observed = np.unpackbits(packed["observed"], axis=-1, count=MINUTES_INTERVALS_NUMBER).astype(bool)
+        return ActivityMatrix(packed[ID_KEY], start, online, observed)
+
+    def get_weekdays(self) -> np.ndarray:
+        """Weekday (Monday is 0) of every day of the matrix."""
+        return (self.start.weekday() + np.arange(self.days_number)) % WEEKDAYS_NUMBER
+
+    def get_online_probability_profiles(self) -> np.ndarray:
+        """Probability of every follower to be online in every interval of every weekday. Result has shape
+           (followers, 7, intervals) and contains NaN for weekday intervals that were never observed."""
+        weekdays = self.get_weekdays()
+        shape = (len(self.follower_ids), WEEKDAYS_NUMBER, MINUTES_INTERVALS_NUMBER)
+        online_counts = np.zeros(shape, dtype=np.int32)
+        observed_counts = np.zeros(shape, dtype=np.int32)
+        for weekday in range(WEEKDAYS_NUMBER):
+            weekday_mask = weekdays == weekday
+            if not weekday_mask.any():
+                continue
+            online_counts[:, weekday] = self.online[:, weekday_mask].sum(axis=1)
+            observed_counts[:, weekday] = self.observed[:, weekday_mask].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(observed_counts > 0, online_counts / np.maximum(observed_counts, 1), np.nan)
+
+    def get_similarity_matrix(self, metric: str = JACCARD_SIMILARITY) -> np.ndarray:
+        """Pairwise co-online similarity of followers of shape (followers, followers). Intervals that weren't
+           observed count as offline. Co-online counts are computed as a product of the matrix with its transpose
+           in chunks of intervals."""
+        followers_number = len(self.follower_ids)
+        flat_online = self.online.reshape(followers_number, -1)
+        intervals_number = flat_online.shape[1]
+
+        co_online = np.zeros((followers_number, followers_number), dtype=np.float64)
+        for chunk_start in range(0, intervals_number, SIMILARITY_COLUMNS_CHUNK_SIZE):
+            chunk = flat_online[:, chunk_start:chunk_start + SIMILARITY_COLUMNS_CHUNK_SIZE].astype(np.float32)
+            co_online += chunk @ chunk.T
+        online_counts = np.diag(co_online).copy()
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if metric == JACCARD_SIMILARITY:
+                union = online_counts[:, None] + online_counts[None, :] - co_online
+                similarity = np.where(union > 0, co_online / union, 0.0)
+            elif metric == CORRELATION_SIMILARITY:
+                # Pearson correlation of binary vectors expressed through co-online counts.
+                probabilities = online_counts / max(intervals_number, 1)
+                covariance = co_online / max(intervals_number, 1) - np.outer(probabilities, probabilities)
+                deviations = np.sqrt(probabilities * (1 - probabilities))
+                norm = np.outer(deviations, deviations)
+                similarity = np.where(norm > 0, covariance / norm, 0.0)
+            else:
+                raise ValueError(f"Unknown similarity metric[{metric}].")
+        return similarity
+
+    def get_top_neighbours(self, k: int, metric: str = JACCARD_SIMILARITY) -> List[FollowerNeighbours]:
+        """`k` most similar followers of every follower sorted by similarity."""
+        similarity = self.get_similarity_matrix(metric)
+        np.fill_diagonal(similarity, -np.inf)
+        k = min(k, len(self.follower_ids) - 1)
+        if k <= 0:
+            return [FollowerNeighbours(int(follower_id), [], []) for follower_id in self.follower_ids]
+
+        top_indices = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_similarities = np.take_along_axis(similarity, top_indices, axis=1)
+        order = np.argsort(-top_similarities, axis=1)
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_similarities = np.take_along_axis(top_similarities, order, axis=1)
+
+        return [
+            FollowerNeighbours(int(follower_id), self.follower_ids[top_indices[row]].tolist(),
+                               top_similarities[row].tolist())
+            for row, follower_id in enumerate(self.follower_ids)
+        ]
+
+    def get_peak_activity_slots(self, top_n: int = 10) -> List[ActivitySlot]:
+        """Intervals of the day in which the largest amount of followers is online on average over observed days."""
+        online_per_slot = self.online.sum(axis=0).astype(np.float64)
+        observed_days = self.observed.any(axis=0)
+        slots_observed_days = observed_days.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average_online = np.where(slots_observed_days > 0,
+                                      online_per_slot.sum(axis=0) / np.maximum(slots_observed_days, 1), 0.0)
+        top_n = min(top_n, MINUTES_INTERVALS_NUMBER)
+        top_slots = np.argsort(-average_online, kind="stable")[:top_n]
+        return [ActivitySlot(int(slot), float(average_online[slot])) for slot in top_slots]
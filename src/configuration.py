@@ -3,6 +3,7 @@ VK_CONFIG_PATH = "secrets/vkconfig.json"
 COMMUNITY_ACCESS_TOKEN_KEY = "community_access_token"
 SERVICE_TOKEN_KEY = "service_token"
 GROUP_ID_KEY = "community_id"
+TRACKED_COMMUNITY_IDS_KEY = "tracked_community_ids"
 VK_API_VERSION = "5.131"
 APP_ID_KEY = "app_id"
 SECURE_KEY_KEY = "secure_key"
@@ -29,3 +30,24 @@ MINUTES_INTERVAL = 2
 # The number of intervals of chosen length `MINUTES_INTERVAL` that fits into one day (e.g. in case the interval is
 # equal to 2 minutes, there will be 720 such intervals).
 MINUTES_INTERVALS_NUMBER = 24 * 60 // MINUTES_INTERVAL
+
+# File in which followers profiles cache is persisted between worker restarts.
+FOLLOWER_PROFILE_CACHE_PATH = "secrets/follower_profiles.json"
+
+# Directory where activity history is exported to (partitioned by day).
+ACTIVITY_EXPORT_PATH = "exports/activity"
+
+# Amount of polling worker processes started by `worker_sharded_clock.py` by default.
+SHARDED_WORKERS_NUMBER = 1
+
+# Profiling (see `src/profiling.py`).
+# * Environment variable switching the profiler on ("1").
+PROFILING_ENABLED_ENV_KEY = "PROFILING_ENABLED"
+# * Environment variable with the amount of first profiled sections captured with cProfile and tracemalloc.
+PROFILING_CAPTURE_NEXT_ENV_KEY = "PROFILING_CAPTURE_NEXT"
+# * Amount of the last sections measurements kept in memory.
+PROFILING_RING_BUFFER_SIZE = 1000
+# * Directory captured profiles are written to.
+PROFILING_CAPTURE_PATH = "secrets/profiles"
+# * Interval of measurements reports of workers that are not driven by a scheduler (e.g. the bot).
+PROFILING_REPORT_INTERVAL_SECONDS = 10 * 60
@@ -0,0 +1,255 @@
+import datetime
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.db.constants import *
+from src.db.sharding import get_stable_hash
+from src.utils import Utils
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # Parquet export is optional, activity is exported into NumPy files when `pyarrow` is not installed.
+    pyarrow = None
+
+PARQUET_FORMAT = "parquet"
+# Compressed `.npz` archive per day.
+NPZ_FORMAT = "npz"
+# Directory per day with one `.npy` file per column. Such columns can be opened with `np.load(mmap_mode="r")`.
+NPY_FORMAT = "npy"
+
+# Columns of the exported activity. Absent `last_seen_datetime` and `platform` are stored as -1.
+ACTIVITY_EXPORT_COLUMNS = {
+    ID_KEY: np.int64,
+    MINUTES_INTERVAL_NUMBER_KEY: np.int16,
+    # Unix time in seconds.
+    DATETIME_KEY: np.int64,
+    LAST_SEEN_DATETIME_KEY: np.int64,
+    ONLINE_KEY: np.int8,
+    PLATFORM_KEY: np.int8,
+    # 1 for statuses that weren't requested from Vk API but inferred.
+    INFERRED_KEY: np.int8,
+}
+
+DAY_PARTITION_FORMAT = "%Y-%m-%d"
+# Prefix of directories with activity of some followers only (see `ActivityExporter`).
+FOLLOWERS_SUBSET_DIRECTORY_PREFIX = "followers-"
+
+
+def get_default_export_format() -> str:
+    return PARQUET_FORMAT if pyarrow is not None else NPZ_FORMAT
+
+
+def local_datetime_to_unix_seconds(date: Optional[datetime.datetime]) -> int:
+    """Activity datetimes are stored in local time of the worker (see `VkWorker.get_followers_current_online_status`),
+       the same clock is used for day partitions."""
+    if date is None:
+        return -1
+    return int(date.timestamp())
+
+
+def utc_datetime_to_unix_seconds(date: Optional[datetime.datetime]) -> int:
+    """`last_seen` datetimes are stored in UTC as they are received from Vk API."""
+    if date is None:
+        return -1
+    return int(date.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def get_followers_subset_directory_name(follower_ids: List[int]) -> str:
+    ids_string = ",".join(str(follower_id) for follower_id in sorted(set(follower_ids)))
+    return f"{FOLLOWERS_SUBSET_DIRECTORY_PREFIX}{get_stable_hash(ids_string):016x}"
+
+
+@dataclass
+class ActivityExportReport:
+    exported_days: List[datetime.datetime]
+    skipped_days: List[datetime.datetime]
+    rows: int
+    seconds: float
+
+
+class ActivityColumnsBuffer:
+    """Growing column arrays of one day activity."""
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.chunks: Dict[str, List[np.ndarray]] = {column: [] for column in ACTIVITY_EXPORT_COLUMNS}
+        self.current = self.new_chunk()
+        self.current_size = 0
+
+    def new_chunk(self) -> Dict[str, np.ndarray]:
+        return {column: np.empty(self.chunk_size, dtype) for column, dtype in ACTIVITY_EXPORT_COLUMNS.items()}
+
+    def append(self, activity: dict):
+        index = self.current_size
+        self.current[ID_KEY][index] = activity[ID_KEY]
+        self.current[MINUTES_INTERVAL_NUMBER_KEY][index] = activity[MINUTES_INTERVAL_NUMBER_KEY]
+        self.current[DATETIME_KEY][index] = local_datetime_to_unix_seconds(activity[DATETIME_KEY])
+        self.current[LAST_SEEN_DATETIME_KEY][index] = utc_datetime_to_unix_seconds(activity.get(LAST_SEEN_DATETIME_KEY))
+        self.current[ONLINE_KEY][index] = bool(activity[ONLINE_KEY])
+        platform = activity.get(PLATFORM_KEY)
+        self.current[PLATFORM_KEY][index] = platform if platform is not None else -1
+        self.current[INFERRED_KEY][index] = bool(activity.get(INFERRED_KEY, False))
+        self.current_size += 1
+        if self.current_size == self.chunk_size:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        for column, values in self.current.items():
+            self.chunks[column].append(values[:self.current_size])
+        self.current = self.new_chunk()
+        self.current_size = 0
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks[ID_KEY]) + self.current_size
+
+    def build(self) -> Dict[str, np.ndarray]:
+        if self.current_size > 0:
+            self.flush_chunk()
+        return {
+            column: np.concatenate(chunks) if chunks else np.empty(0, ACTIVITY_EXPORT_COLUMNS[column])
+            for column, chunks in self.chunks.items()
+        }
+
+
+class ActivityExporter:
+    """Exports activity history into columnar files partitioned by day (one file or directory per day named
+       `YYYY-MM-DD`), so that analysis jobs don't have to scan `activity_data` collection.
+       Only complete days are exported, days that are already exported are skipped unless `overwrite` is set.
+       Activity of `follower_ids` only is exported into a separate subdirectory of `export_path`, so that its days
+       are not taken for the days of the full export."""
+
+    def __init__(
+            self,
+            mongo_worker,
+            export_path: str,
+            export_format: Optional[str] = None,
+            batch_size: int = ACTIVITY_READ_BATCH_SIZE,
+            follower_ids: Optional[List[int]] = None
+    ):
+        self.mongo_worker = mongo_worker
+        self.follower_ids = follower_ids
+        if follower_ids is not None:
+            export_path = os.path.join(export_path, get_followers_subset_directory_name(follower_ids))
+        self.export_path = export_path
+        self.export_format = export_format if export_format is not None else get_default_export_format()
+        if self.export_format == PARQUET_FORMAT and pyarrow is None:
+            raise ValueError("Parquet export requires `pyarrow` to be installed.")
+        if self.export_format not in (PARQUET_FORMAT, NPZ_FORMAT, NPY_FORMAT):
+            raise ValueError(f"Unknown export format[{self.export_format}].")
+        self.batch_size = batch_size
+
+    def get_day_path(self, day: datetime.datetime) -> str:
+        day_name = day.strftime(DAY_PARTITION_FORMAT)
+        if self.export_format == PARQUET_FORMAT:
+            return os.path.join(self.export_path, f"{day_name}.parquet")
+        elif self.export_format == NPZ_FORMAT:
+            return os.path.join(self.export_path, f"{day_name}.npz")
+        return os.path.join(self.export_path, day_name)
+
+    def get_exported_days(self) -> List[datetime.datetime]:
+        if not os.path.isdir(self.export_path):
+            return []
+        days = []
+        for file_name in os.listdir(self.export_path):
+            day_name = os.path.splitext(file_name)[0]
+            try:
+                day = Utils.get_datetime_from_string(day_name, DAY_PARTITION_FORMAT)
+            except ValueError:
+                continue
+            if os.path.exists(self.get_day_path(day)):
+                days.append(day)
+        return sorted(days)
+
+    def export(
+            self,
+            start: Optional[datetime.datetime] = None,
+            end: Optional[datetime.datetime] = None,
+            overwrite: bool = False
+    ) -> ActivityExportReport:
+        """Export days in [`start`, `end`). By default `start` is the day after the last exported one (or the first
+           day with activity) and `end` is today, so that repeated calls export only new days. `end` is never later
+           than today."""
+        started_at = datetime.datetime.now()
+        # Today is not complete yet, so it (as well as future days) would be exported partially or empty, and then
+        # skipped by incremental exports as already exported.
+        today = Utils.get_date_truncated_by_day(started_at)
+        end = min(Utils.get_date_truncated_by_day(end), today) if end is not None else today
+        if start is None:
+            exported_days = self.get_exported_days()
+            if exported_days:
+                start = exported_days[-1] + datetime.timedelta(days=1)
+            else:
+                start = self.mongo_worker.get_first_activity_datetime()
+        if start is None:
+            Utils.log("There is no activity to export.")
+            return ActivityExportReport([], [], 0, 0.0)
+        start = Utils.get_date_truncated_by_day(start)
+
+        os.makedirs(self.export_path, exist_ok=True)
+        exported, skipped, rows = [], [], 0
+        day = start
+        while day < end:
+            if not overwrite and os.path.exists(self.get_day_path(day)):
+                skipped.append(day)
+            else:
+                rows += self.export_day(day)
+                exported.append(day)
+            day += datetime.timedelta(days=1)
+
+        seconds = (datetime.datetime.now() - started_at).total_seconds()
+        rows_per_second = rows / seconds if seconds > 0 else 0.0
+        Utils.log(f"Exported {rows} activities of {len(exported)} days into [{self.export_path}] "
+                  f"({rows_per_second:.1f} rows/s), skipped {len(skipped)} already exported days.")
+        return ActivityExportReport(exported, skipped, rows, seconds)
+
+    def export_day(self, day: datetime.datetime) -> int:
+        buffer = ActivityColumnsBuffer(self.batch_size)
+        next_day = day + datetime.timedelta(days=1)
+        for activity in self.mongo_worker.iterate_activities(day, next_day, self.follower_ids, self.batch_size):
+            buffer.append(activity)
+        columns = buffer.build()
+        self.write_day(day, columns)
+        return len(columns[ID_KEY])
+
+    def write_day(self, day: datetime.datetime, columns: Dict[str, np.ndarray]):
+        """Write day columns into a temporary path first, so that interrupted export doesn't leave a partial day
+           that would be skipped by the next incremental export. Temporary path is unique per process, as several
+           workers may export the same day at once (see `VkWorker.refresh_adaptive_polling_profiles`)."""
+        day_path = self.get_day_path(day)
+        temporary_path = f"{day_path}.{os.getpid()}.tmp"
+        if self.export_format == PARQUET_FORMAT:
+            table = pyarrow.table(columns)
+            pyarrow.parquet.write_table(table, temporary_path, compression="zstd")
+        elif self.export_format == NPZ_FORMAT:
+            with open(temporary_path, 'wb') as day_file:
+                np.savez_compressed(day_file, **columns)
+        else:
+            os.makedirs(temporary_path, exist_ok=True)
+            for column, values in columns.items():
+                np.save(os.path.join(temporary_path, f"{column}.npy"), values)
+        if os.path.isdir(day_path):
+            for file_name in os.listdir(day_path):
+                os.remove(os.path.join(day_path, file_name))
+            os.rmdir(day_path)
+        os.replace(temporary_path, day_path)
+
+
+def load_exported_day(day_path: str, mmap: bool = False, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Read columns of the day exported by `ActivityExporter` (all of them unless `columns` are given). With `mmap` set
+       columns of `npy` export are memory-mapped instead of being read."""
+    if day_path.endswith(".parquet"):
+        table = pyarrow.parquet.read_table(day_path, columns=columns)
+        return {column: table.column(column).to_numpy() for column in table.column_names}
+    elif day_path.endswith(".npz"):
+        with np.load(day_path) as day_file:
+            return {column: day_file[column] for column in day_file.files if columns is None or column in columns}
+    return {
+        column: np.load(os.path.join(day_path, f"{column}.npy"), mmap_mode="r" if mmap else None)
+        for column in (columns if columns is not None else ACTIVITY_EXPORT_COLUMNS)
+        if os.path.exists(os.path.join(day_path, f"{column}.npy"))
+    }
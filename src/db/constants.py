@@ -1,3 +1,5 @@
+from src.configuration import MINUTES_INTERVAL
+
 MONGO_ID_KEY = "_id"
 ID_KEY = "id"
 FIRST_NAME_KEY = "name"
@@ -5,6 +7,8 @@ LAST_NAME_KEY = "surname"
 SECRET_KEY_KEY = "secret_key"
 IS_PUBLIC_KEY = "is_public"
 POST_OBJECT_ID_KEY = "post_object_id"
+# (post_id, comment_id) of the comment the bot left for the follower that liked posts.
+BOT_COMMENT_KEY = "bot_comment"
 TEXT_KEY = "text"
 
 
@@ -13,7 +17,37 @@ DATETIME_KEY = "datetime"
 LAST_SEEN_DATETIME_KEY = "last_seen_datetime"
 ONLINE_KEY = "online"
 PLATFORM_KEY = "platform"
+INFERRED_KEY = "inferred"
 
 
 MONGODB_USERNAME_KEY = "MONGODB_USERNAME"
 MONGODB_PASSWORD_KEY = "MONGODB_PASSWORD"
+
+
+# Migrations.
+# * Keys of the documents in `migrations` collection that store migrations progress.
+MIGRATION_LAST_ID_KEY = "last_id"
+MIGRATION_PROCESSED_KEY = "processed"
+MIGRATION_MODIFIED_KEY = "modified"
+MIGRATION_FINISHED_KEY = "finished"
+# * Amount of documents read and written with one `bulk_write` call.
+MIGRATION_BATCH_SIZE = 1000
+# * Amount of threads writing batches in parallel.
+MIGRATION_WORKERS_NUMBER = 2
+# * Time each worker sleeps after writing a batch so that migration doesn't slow down the live workload.
+MIGRATION_THROTTLE_SECONDS = 0.1
+
+# Activity reading.
+# * Amount of activity documents fetched from the server in one batch while streaming them.
+ACTIVITY_READ_BATCH_SIZE = 5000
+
+# Sharded polling.
+EXPIRES_AT_KEY = "expires_at"
+MEMBER_IDS_KEY = "member_ids"
+UPDATED_AT_KEY = "updated_at"
+# * Time during which polling worker is considered alive after renewing its lease. Worker renews it every tick, so it
+#   has to be longer than a few ticks to survive a slow one.
+WORKER_LEASE_SECONDS = 3 * 60 * MINUTES_INTERVAL
+# * Amount of points every worker gets on the consistent hashing ring. The more points, the more even followers are
+#   spread between workers.
+HASH_RING_VIRTUAL_NODES_NUMBER = 64
@@ -0,0 +1,182 @@
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+from src.db.constants import *
+from src.utils import Utils
+
+
+@dataclass
+class MigrationReport:
+    name: str
+    processed: int
+    modified: int
+    seconds: float
+    dry_run: bool
+
+    def documents_per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds > 0 else 0.0
+
+
+class Migration(ABC):
+    """Maintenance update of all documents of one collection. Subclasses define which documents are affected and how
+       each of them is updated. Updates must be idempotent as soon as the batch written right before interruption
+       is processed once again on resume."""
+    name: str = ""
+    collection_name: str = ""
+
+    def get_filter(self) -> dict:
+        """Filter of documents that are passed to `get_update`."""
+        return {}
+
+    def get_projection(self) -> Optional[dict]:
+        """Fields of documents that `get_update` needs (None means all the fields)."""
+        return None
+
+    @abstractmethod
+    def get_update(self, document: dict) -> Optional[dict]:
+        """Update of the concrete document or None in case the document doesn't need one."""
+
+
+class FollowersPublicityResetMigration(Migration):
+    """Make all accounts private."""
+    name = "followers_publicity_reset"
+    collection_name = "accounts"
+
+    def get_projection(self) -> Optional[dict]:
+        return {MONGO_ID_KEY: True}
+
+    def get_update(self, document: dict) -> Optional[dict]:
+        return {"$set": {IS_PUBLIC_KEY: False},
+                "$currentDate": {"lastModified": True}}
+
+
+class ActivityDatetimeTruncationMigration(Migration):
+    """Truncate activity datetimes by minutes (see `Utils.get_date_truncated_by_minutes`)."""
+    name = "activity_datetime_truncation"
+    collection_name = "activity_data"
+
+    def get_projection(self) -> Optional[dict]:
+        return {MONGO_ID_KEY: True, DATETIME_KEY: True}
+
+    def get_update(self, document: dict) -> Optional[dict]:
+        date = document.get(DATETIME_KEY)
+        if date is None or (date.second == 0 and date.microsecond == 0):
+            return None
+        return {"$set": {DATETIME_KEY: Utils.get_date_truncated_by_minutes(date)},
+                "$currentDate": {"lastModified": True}}
+
+
+class MigrationRunner:
+    """Runs migrations in batches of documents ranged by `_id`. Batches are written with `bulk_write` by
+       `workers_number` threads, and progress is checkpointed into `migrations` collection after every batch, so
+       that interrupted migration continues from the last checkpoint on the next run. Migration that was finished
+       runs over all the documents again (e.g. to update the ones inserted since then).
+       In dry-run mode nothing is written (neither documents nor checkpoints), only counted."""
+
+    def __init__(
+            self,
+            mongo_worker,
+            batch_size: int = MIGRATION_BATCH_SIZE,
+            workers_number: int = MIGRATION_WORKERS_NUMBER,
+            throttle_seconds: float = MIGRATION_THROTTLE_SECONDS,
+            dry_run: bool = False
+    ):
+        self.db = mongo_worker.db
+        self.migrations = self.db.migrations
+        self.batch_size = batch_size
+        self.workers_number = workers_number
+        self.throttle_seconds = throttle_seconds
+        self.dry_run = dry_run
+
+    def run(self, migration: Migration, restart: bool = False) -> MigrationReport:
+        """Run the migration. Unless `restart` is set, unfinished run is resumed from its checkpoint."""
+        collection = self.db[migration.collection_name]
+        checkpoint = None if restart else self.migrations.find_one({MONGO_ID_KEY: migration.name})
+        if checkpoint is not None and checkpoint.get(MIGRATION_FINISHED_KEY):
+            Utils.log(f"Migration[{migration.name}] was finished before, running it once again.")
+            checkpoint = None
+        last_id = checkpoint[MIGRATION_LAST_ID_KEY] if checkpoint is not None else None
+        processed = checkpoint[MIGRATION_PROCESSED_KEY] if checkpoint is not None else 0
+        modified = checkpoint[MIGRATION_MODIFIED_KEY] if checkpoint is not None else 0
+        Utils.log(f"Migration[{migration.name}] started from _id[{last_id}]. Dry run: {self.dry_run}.")
+
+        started_at = time.time()
+        run_processed, run_modified = 0, 0
+        # Batches that are being written, in the order of their `_id` ranges. Checkpoint is moved only after all
+        # the preceding batches are written.
+        pending_batches = []
+        with ThreadPoolExecutor(max_workers=self.workers_number) as executor:
+            while True:
+                documents = self.read_batch(collection, migration, last_id)
+                if not documents:
+                    break
+                last_id = documents[-1][MONGO_ID_KEY]
+                future = executor.submit(self.write_batch, collection, migration, documents)
+                pending_batches.append((last_id, len(documents), future))
+
+                # Don't read further than workers can write.
+                while len(pending_batches) >= self.workers_number or (pending_batches and pending_batches[0][2].done()):
+                    batch_last_id, batch_processed, batch_future = pending_batches.pop(0)
+                    batch_modified = batch_future.result()
+                    run_processed += batch_processed
+                    run_modified += batch_modified
+                    self.save_checkpoint(migration, batch_last_id, processed + run_processed,
+                                         modified + run_modified, False)
+                    self.log_progress(migration, run_processed, run_modified, started_at)
+
+            for batch_last_id, batch_processed, batch_future in pending_batches:
+                run_processed += batch_processed
+                run_modified += batch_future.result()
+                self.save_checkpoint(migration, batch_last_id, processed + run_processed, modified + run_modified, False)
+
+        self.save_checkpoint(migration, last_id, processed + run_processed, modified + run_modified, True)
+        report = MigrationReport(migration.name, run_processed, run_modified, time.time() - started_at, self.dry_run)
+        Utils.log(f"Migration[{migration.name}] finished: {report.processed} documents processed, "
+                  f"{report.modified} modified in {report.seconds:.1f}s "
+                  f"({report.documents_per_second():.1f} documents/s).")
+        return report
+
+    def read_batch(self, collection, migration: Migration, last_id) -> List[dict]:
+        documents_filter = dict(migration.get_filter())
+        if last_id is not None:
+            documents_filter[MONGO_ID_KEY] = {"$gt": last_id}
+        cursor = collection.find(documents_filter, migration.get_projection())
+        return list(cursor.sort(MONGO_ID_KEY, 1).limit(self.batch_size))
+
+    def write_batch(self, collection, migration: Migration, documents: List[dict]) -> int:
+        """Write updates of the batch. Returns amount of modified (or to be modified in dry-run mode) documents."""
+        from pymongo import UpdateOne
+
+        operations = []
+        for document in documents:
+            update = migration.get_update(document)
+            if update is not None:
+                operations.append(UpdateOne({MONGO_ID_KEY: document[MONGO_ID_KEY]}, update))
+        if self.dry_run or not operations:
+            return len(operations)
+        result = collection.bulk_write(operations, ordered=False)
+        if self.throttle_seconds > 0:
+            time.sleep(self.throttle_seconds)
+        return result.modified_count
+
+    def save_checkpoint(self, migration: Migration, last_id, processed: int, modified: int, finished: bool):
+        if self.dry_run:
+            return
+        self.migrations.update_one(
+            {MONGO_ID_KEY: migration.name},
+            {"$set": {MIGRATION_LAST_ID_KEY: last_id,
+                      MIGRATION_PROCESSED_KEY: processed,
+                      MIGRATION_MODIFIED_KEY: modified,
+                      MIGRATION_FINISHED_KEY: finished},
+             "$currentDate": {"lastModified": True}},
+            upsert=True
+        )
+
+    def log_progress(self, migration: Migration, processed: int, modified: int, started_at: float):
+        seconds = time.time() - started_at
+        documents_per_second = processed / seconds if seconds > 0 else 0.0
+        Utils.log(f"Migration[{migration.name}]: {processed} documents processed, {modified} modified "
+                  f"({documents_per_second:.1f} documents/s).")
@@ -1,15 +1,17 @@
 import datetime
 import json
 import os
-from typing import List, Optional
-
-import pymongo
+from functools import cached_property
+from typing import Iterator, List, Optional
 
 from src.configuration import MONGODB_CONFIG_LOGIN_KEY, MONGODB_CONFIG_PATH, SERVER_CONFIG_PATH, SERVER_IP_KEY, \
     SERVER_PORT_KEY, MONGODB_CONFIG_PASSWORD_KEY
+from src.profiling import profiled
 from src.utils import Utils
 from src.db.constants import *
-from src.vk.model import PrivateFollowerInfo, PublicFollowerInfo, BotMessage
+from src.db.migrations import MigrationRunner, MigrationReport, FollowersPublicityResetMigration, \
+    ActivityDatetimeTruncationMigration
+from src.vk.model import PrivateFollowerInfo, PublicFollowerInfo, BotMessage, FollowerOnlineStatus
 
 
 class MongoWorker:
@@ -23,15 +25,26 @@ class MongoWorker:
             mongodb_login = config_data[MONGODB_CONFIG_LOGIN_KEY]
             mongodb_password = config_data[MONGODB_CONFIG_PASSWORD_KEY]
 
-        connection_url = f"mongodb://{mongodb_login}:{mongodb_password}@{server_ip}:{server_port}/"
-        self.client = pymongo.MongoClient(connection_url)
-        self.db = self.client.gb
+        self.connection_url = f"mongodb://{mongodb_login}:{mongodb_password}@{server_ip}:{server_port}/"
+
+    @cached_property
+    def client(self):
+        """Client is created (and `pymongo` is imported) on first use so that workers start quickly."""
+        import pymongo
+
+        return pymongo.MongoClient(self.connection_url)
+
+    @cached_property
+    def db(self):
+        return self.client.gb
 
-        # Collections:
-        self.likes = self.db.likes
-        # self.accounts = self.db.accounts
-        # self.activity_data = self.db.activity_data
-        # self.bot_messages = self.db.bot_messages
+    # Collections:
+    @cached_property
+    def likes(self):
+        return self.db.likes
+    # self.accounts = self.db.accounts
+    # self.activity_data = self.db.activity_data
+    # self.bot_messages = self.db.bot_messages
 
     def add_user_liked_post(self, follower_id: int, post_id: int) -> bool:
         result = list(self.likes.find({ID_KEY : follower_id}))
@@ -65,6 +78,32 @@ class MongoWorker:
                 return False
             else:
                 return True
+
+    def get_user_liked_posts_count(self, follower_id: int) -> int:
+        """Number of posts the follower still likes."""
+        result = self.likes.find_one({ID_KEY: follower_id}, {POST_OBJECT_ID_KEY: True})
+        if result is None:
+            return 0
+        return len(result.get(POST_OBJECT_ID_KEY, []))
+
+    def get_user_bot_comment(self, follower_id: int) -> Optional[tuple]:
+        """(post_id, comment_id) of the comment the bot left for the follower or None."""
+        result = self.likes.find_one({ID_KEY: follower_id}, {BOT_COMMENT_KEY: True})
+        if result is None or result.get(BOT_COMMENT_KEY) is None:
+            return None
+        post_id, comment_id = result[BOT_COMMENT_KEY]
+        return post_id, comment_id
+
+    def set_user_bot_comment(self, follower_id: int, post_id: int, comment_id: int):
+        self.likes.update_one(
+            {ID_KEY: follower_id},
+            {"$set": {BOT_COMMENT_KEY: [post_id, comment_id]}},
+            upsert=True
+        )
+
+    def remove_user_bot_comment(self, follower_id: int):
+        self.likes.update_one({ID_KEY: follower_id}, {"$unset": {BOT_COMMENT_KEY: ""}})
+
     def get_user_secret_key_by_id(self, follower_id: int) -> Optional[str]:
         """Get u"""
         result = self.accounts.find_one({ID_KEY: follower_id})
@@ -104,52 +143,42 @@ class MongoWorker:
         )
         return new_publicity_status
 
+    @profiled("tick.write_accounts")
     def prepare_accounts_collection(self, followers_info: List[PrivateFollowerInfo]):
         self.insert_followers_info(followers_info)
         Utils.log("Prepared followers info")
 
-    def fix_followers_collection(self):
-        accounts = self.accounts.find()
-        for account in accounts:
-            self.accounts.update_one(
-                {ID_KEY: account[ID_KEY]},
-                {"$set": {IS_PUBLIC_KEY: False},
-                 "$currentDate": {"lastModified": True}}
-            )
-
-    def fix_activity_collection(self):
-        activity_data = self.activity_data.find()
-
-        def update_datetime():
-            unique_dates = [activity[DATETIME_KEY] for activity in activity_data]
-            unique_dates = sorted(list(set(unique_dates)))
-            for date in unique_dates:
-                updated_date = Utils.get_date_truncated_by_minutes(date)
-                self.activity_data.update_many(
-                    {DATETIME_KEY: date},
-                    {"$set": {DATETIME_KEY: updated_date},
-                     "$currentDate": {"lastModified": True}}
-                )
-                print(f"Updated {date}")
-
-        def update_last_seen_datetime():
-            self.activity_data.update_many(
-                {},
-                {"$set": {LAST_SEEN_DATETIME_KEY: None},
-                 "$currentDate": {"lastModified": True}}
-            )
-
-        def check():
-            for activity in activity_data:
-                date = activity[DATETIME_KEY]
-                if date.second_i != 0 or date.microsecond != 0:
-                    print(date)
-
-        check()
+    def fix_followers_collection(
+            self,
+            dry_run: bool = False,
+            restart: bool = False,
+            workers_number: int = MIGRATION_WORKERS_NUMBER,
+            throttle_seconds: float = MIGRATION_THROTTLE_SECONDS
+    ) -> MigrationReport:
+        """Make all accounts private. Interrupted run is resumed unless `restart` is set, see `MigrationRunner`."""
+        migration_runner = MigrationRunner(self, workers_number=workers_number, throttle_seconds=throttle_seconds,
+                                           dry_run=dry_run)
+        return migration_runner.run(FollowersPublicityResetMigration(), restart=restart)
+
+    def fix_activity_collection(
+            self,
+            dry_run: bool = True,
+            restart: bool = False,
+            workers_number: int = MIGRATION_WORKERS_NUMBER,
+            throttle_seconds: float = MIGRATION_THROTTLE_SECONDS
+    ) -> MigrationReport:
+        """Truncate activity datetimes by minutes. By default only counts activities with not truncated datetimes."""
+        migration_runner = MigrationRunner(self, workers_number=workers_number, throttle_seconds=throttle_seconds,
+                                           dry_run=dry_run)
+        return migration_runner.run(ActivityDatetimeTruncationMigration(), restart=restart)
 
     def insert_activity_info(self, followers_info: List[PublicFollowerInfo]):
-        activities_info = self.vk_worker.get_followers_current_online_status(followers_info)
+        activities_info = self.vk_worker.get_followers_online_status(followers_info)
+        self.insert_activities(activities_info)
 
+    @profiled("tick.write_activities")
+    def insert_activities(self, activities_info: List[FollowerOnlineStatus]):
+        activity_documents = []
         for activity_info in activities_info:
             activity_document = {
                 ID_KEY: activity_info.follower_id,
@@ -157,10 +186,45 @@ class MongoWorker:
                 DATETIME_KEY: activity_info.datetime,
                 LAST_SEEN_DATETIME_KEY: activity_info.last_seen_datetime,
                 ONLINE_KEY: activity_info.online,
-                PLATFORM_KEY: activity_info.platform
+                PLATFORM_KEY: activity_info.platform,
+                INFERRED_KEY: activity_info.inferred
             }
-            self.activity_data.insert_one(activity_document)
-        Utils.log(f"Inserted activities info")
+            activity_documents.append(activity_document)
+        if activity_documents:
+            self.db.activity_data.insert_many(activity_documents, ordered=False)
+        Utils.log(f"Inserted {len(activity_documents)} activities info")
+
+    def update_community_members(self, community_id: int, member_ids: List[int]):
+        self.db.communities.update_one(
+            {MONGO_ID_KEY: community_id},
+            {"$set": {MEMBER_IDS_KEY: member_ids, UPDATED_AT_KEY: datetime.datetime.utcnow()}},
+            upsert=True
+        )
+
+    def get_community_members(self, community_id: int) -> Optional[List[int]]:
+        """Member ids stored by `update_community_members` (None in case they weren't stored yet)."""
+        community = self.db.communities.find_one({MONGO_ID_KEY: community_id}, {MEMBER_IDS_KEY: True})
+        return community[MEMBER_IDS_KEY] if community is not None else None
+
+    def iterate_activities(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime,
+            follower_ids: Optional[List[int]] = None,
+            batch_size: int = ACTIVITY_READ_BATCH_SIZE
+    ) -> Iterator[dict]:
+        """Stream activity documents gathered in [`start`, `end`) (optionally only of `follower_ids`) in no particular
+           order. Documents are fetched from the server in batches of `batch_size`."""
+        activities_filter = {DATETIME_KEY: {"$gte": start, "$lt": end}}
+        if follower_ids is not None:
+            activities_filter[ID_KEY] = {"$in": list(follower_ids)}
+        projection = {MONGO_ID_KEY: False, ID_KEY: True, MINUTES_INTERVAL_NUMBER_KEY: True, DATETIME_KEY: True,
+                      LAST_SEEN_DATETIME_KEY: True, ONLINE_KEY: True, PLATFORM_KEY: True, INFERRED_KEY: True}
+        return iter(self.db.activity_data.find(activities_filter, projection, batch_size=batch_size))
+
+    def get_first_activity_datetime(self) -> Optional[datetime.datetime]:
+        activity = self.db.activity_data.find_one({}, {DATETIME_KEY: True}, sort=[(DATETIME_KEY, 1)])
+        return activity[DATETIME_KEY] if activity is not None else None
 
     def insert_bot_message(self, bot_message_info: BotMessage):
         bot_message_document = {
@@ -169,6 +233,7 @@ class MongoWorker:
         }
         self.bot_messages.insert_one(bot_message_document)
 
+    @profiled("tick")
     def made_interval_activity_filling_action(self):
         followers_info = self.vk_worker.get_all_followers_info()
         self.prepare_accounts_collection(followers_info)
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional, Set
+
+from src.db.sharding import ConsistentHashRing, WorkerLeases
+from src.profiling import profiled
+from src.utils import Utils
+
+
+class ShardedActivityPoller:
+    """Polls activity of members of several communities in one of many worker processes.
+       Members are deduplicated across communities (a follower of two communities is polled once), and followers are
+       spread between alive workers by consistent hashing of follower id. During membership changes (a worker
+       joined or its lease expired) workers may see different sets of alive workers for one tick, so a few followers
+       may be polled twice or skipped in that tick.
+       Only the leader (the first alive worker) requests communities members from Vk API and stores them into
+       `communities` collection, the other workers read members from there, so that membership requests don't
+       multiply with the number of workers sharing the token rate limit."""
+
+    def __init__(self, worker_id: str, vk_worker, mongo_worker, community_ids: Optional[List[int]] = None):
+        self.worker_id = worker_id
+        self.vk_worker = vk_worker
+        self.mongo_worker = mongo_worker
+        self.community_ids = community_ids if community_ids is not None else vk_worker.tracked_community_ids
+        self.leases = WorkerLeases(mongo_worker)
+
+    @profiled("tick.fetch_members")
+    def get_members_by_community(self) -> Dict[int, List[int]]:
+        members_by_community = dict()
+        for community_id in self.community_ids:
+            member_ids = self.vk_worker.get_community_member_ids(community_id)
+            self.mongo_worker.update_community_members(community_id, member_ids)
+            members_by_community[community_id] = member_ids
+        return members_by_community
+
+    @profiled("tick.read_members")
+    def read_members_by_community(self) -> Dict[int, List[int]]:
+        members_by_community = dict()
+        for community_id in self.community_ids:
+            member_ids = self.mongo_worker.get_community_members(community_id)
+            if member_ids is None:
+                # The leader hasn't stored members of the community yet.
+                member_ids = self.vk_worker.get_community_member_ids(community_id)
+            members_by_community[community_id] = member_ids
+        return members_by_community
+
+    @profiled("tick")
+    def made_interval_activity_filling_action(self):
+        self.leases.renew(self.worker_id)
+        alive_worker_ids = self.leases.get_alive_worker_ids()
+        if self.worker_id not in alive_worker_ids:
+            # Lease could expire right after renewal in case the tick was too slow.
+            alive_worker_ids = sorted(alive_worker_ids + [self.worker_id])
+
+        if alive_worker_ids[0] == self.worker_id:
+            members_by_community = self.get_members_by_community()
+        else:
+            members_by_community = self.read_members_by_community()
+
+        all_member_ids: Set[int] = set()
+        for member_ids in members_by_community.values():
+            all_member_ids.update(member_ids)
+        ring = ConsistentHashRing(alive_worker_ids)
+        own_member_ids = ring.get_worker_follower_ids(self.worker_id, sorted(all_member_ids))
+
+        follower_profile_cache = self.vk_worker.follower_profile_cache
+        follower_profile_cache.reserve(len(own_member_ids))
+        followers_info = list(follower_profile_cache.get_many(own_member_ids).values())
+        follower_profile_cache.save()
+        activities_info = self.vk_worker.get_followers_online_status(followers_info)
+        self.mongo_worker.insert_activities(activities_info)
+        Utils.log(f"Worker[{self.worker_id}] polled {len(own_member_ids)} of {len(all_member_ids)} members of "
+                  f"{len(self.community_ids)} communities ({len(alive_worker_ids)} workers alive).")
+
+    def stop(self):
+        self.leases.release(self.worker_id)
@@ -0,0 +1,62 @@
+import bisect
+import datetime
+import hashlib
+from typing import Iterable, List
+
+from src.db.constants import *
+from src.utils import Utils
+
+
+def get_stable_hash(value: str) -> int:
+    """Hash that is the same in all worker processes (unlike built-in `hash` of strings)."""
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """Assigns followers to workers so that adding or removing a worker moves only the followers of the ring
+       segments it takes or leaves."""
+
+    def __init__(self, worker_ids: Iterable[str], virtual_nodes_number: int = HASH_RING_VIRTUAL_NODES_NUMBER):
+        points = []
+        for worker_id in worker_ids:
+            for virtual_node in range(virtual_nodes_number):
+                points.append((get_stable_hash(f"{worker_id}#{virtual_node}"), worker_id))
+        points.sort()
+        self.point_hashes = [point_hash for point_hash, _ in points]
+        self.point_workers = [worker_id for _, worker_id in points]
+
+    def get_worker(self, follower_id: int) -> str:
+        if not self.point_hashes:
+            raise ValueError("Hash ring has no workers.")
+        index = bisect.bisect(self.point_hashes, get_stable_hash(str(follower_id))) % len(self.point_hashes)
+        return self.point_workers[index]
+
+    def get_worker_follower_ids(self, worker_id: str, follower_ids: Iterable[int]) -> List[int]:
+        return [follower_id for follower_id in follower_ids if self.get_worker(follower_id) == worker_id]
+
+
+class WorkerLeases:
+    """Membership of polling workers coordinated through `worker_leases` collection. Every worker renews its lease
+       each tick, workers whose leases expired (e.g. crashed processes) are no longer considered alive and their
+       followers move to the others."""
+
+    def __init__(self, mongo_worker, lease_seconds: int = WORKER_LEASE_SECONDS):
+        self.leases = mongo_worker.db.worker_leases
+        self.lease_seconds = lease_seconds
+
+    def renew(self, worker_id: str):
+        now = datetime.datetime.utcnow()
+        self.leases.update_one(
+            {MONGO_ID_KEY: worker_id},
+            {"$set": {EXPIRES_AT_KEY: now + datetime.timedelta(seconds=self.lease_seconds)}},
+            upsert=True
+        )
+
+    def release(self, worker_id: str):
+        self.leases.delete_one({MONGO_ID_KEY: worker_id})
+        Utils.log(f"Worker[{worker_id}] released its lease.")
+
+    def get_alive_worker_ids(self) -> List[str]:
+        now = datetime.datetime.utcnow()
+        leases = self.leases.find({EXPIRES_AT_KEY: {"$gt": now}}, {MONGO_ID_KEY: True})
+        return sorted(lease[MONGO_ID_KEY] for lease in leases)
@@ -0,0 +1,225 @@
+import cProfile
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.configuration import PROFILING_ENABLED_ENV_KEY, PROFILING_CAPTURE_NEXT_ENV_KEY, \
+    PROFILING_RING_BUFFER_SIZE, PROFILING_CAPTURE_PATH, PROFILING_REPORT_INTERVAL_SECONDS
+from src.utils import Utils
+
+
+@dataclass
+class ProfileRecord:
+    """Measurements of one execution of a profiled section (e.g. one tick or one event handling)."""
+    name: str
+    # Unix time the section started at.
+    started_at: float
+    wall_seconds: float
+    # CPU time of the thread that executed the section.
+    cpu_seconds: float
+    # Change of the number of memory blocks allocated by the interpreter (see `sys.getallocatedblocks`) during the
+    # section. The counter is process-wide, so allocations of other threads running meanwhile are counted too
+    # (per-section allocations are in tracemalloc snapshots of captured sections).
+    allocated_blocks: int
+
+
+@dataclass
+class ProfileSummary:
+    name: str
+    count: int
+    mean_wall_seconds: float
+    max_wall_seconds: float
+    mean_cpu_seconds: float
+    mean_allocated_blocks: float
+
+
+class Profiler:
+    """Opt-in profiler of worker sections. While disabled, profiled sections cost one attribute check.
+       While enabled, every section execution is recorded into a ring buffer of `ring_buffer_size` records.
+       In addition, the next executions of sections may be captured with cProfile and tracemalloc into
+       `capture_path` (see `capture_next`)."""
+
+    def __init__(self, enabled: bool = False, ring_buffer_size: int = PROFILING_RING_BUFFER_SIZE,
+                 capture_path: str = PROFILING_CAPTURE_PATH):
+        self.enabled = enabled
+        self.records = deque(maxlen=ring_buffer_size)
+        self.capture_path = capture_path
+        self.lock = threading.Lock()
+        self.captures_left = 0
+        # Only sections whose names start with this prefix are captured.
+        self.capture_name_prefix = ""
+        self.captures_done = 0
+        # Whether tracemalloc was started by the profiler (and thus has to be stopped after capturing).
+        self.tracemalloc_started = False
+        # Whether the current thread is inside a captured section. Nested sections are not captured separately,
+        # as soon as one thread can't run two cProfile profilers at once.
+        self.thread_state = threading.local()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def capture_next(self, count: int, name_prefix: str = ""):
+        """Capture cProfile stats and tracemalloc snapshot of the next `count` executions of sections whose names
+           start with `name_prefix`. Enables the profiler."""
+        with self.lock:
+            self.captures_left = count
+            self.capture_name_prefix = name_prefix
+            if count > 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracemalloc_started = True
+        self.enable()
+        Utils.log(f"Profiler will capture next {count} sections[{name_prefix}*] into [{self.capture_path}].")
+
+    def claim_capture(self, name: str) -> Optional[int]:
+        """Take a capture slot for the section execution. Returns capture number or None if it is not captured."""
+        if self.captures_left <= 0 or getattr(self.thread_state, "capturing", False):
+            return None
+        with self.lock:
+            if self.captures_left <= 0 or not name.startswith(self.capture_name_prefix):
+                return None
+            self.captures_left -= 1
+            self.captures_done += 1
+            return self.captures_done
+
+    @contextmanager
+    def measure(self, name: str):
+        """Context manager recording execution of the section named `name`."""
+        if not self.enabled:
+            yield
+            return
+
+        capture_number = self.claim_capture(name)
+        section_profile = None
+        started_at = time.time()
+        wall_started_at = time.perf_counter()
+        cpu_started_at = time.thread_time()
+        allocated_blocks_before = sys.getallocatedblocks()
+        try:
+            if capture_number is not None:
+                section_profile = self.start_capture(name)
+            yield
+        finally:
+            if capture_number is not None:
+                if section_profile is not None:
+                    section_profile.disable()
+                self.thread_state.capturing = False
+            record = ProfileRecord(
+                name,
+                started_at,
+                time.perf_counter() - wall_started_at,
+                time.thread_time() - cpu_started_at,
+                sys.getallocatedblocks() - allocated_blocks_before
+            )
+            self.records.append(record)
+            if capture_number is not None:
+                if section_profile is not None:
+                    self.save_capture(name, capture_number, section_profile)
+                self.finish_capture()
+
+    def start_capture(self, name: str) -> Optional[cProfile.Profile]:
+        """Start cProfile for the captured section. Returns None in case it can't be started (e.g. since Python 3.12
+           only one thread can be profiled at once), then the section is only measured."""
+        self.thread_state.capturing = True
+        section_profile = cProfile.Profile()
+        try:
+            section_profile.enable()
+        except ValueError as e:
+            Utils.log_error(f"Profiler can't capture section[{name}].", e)
+            return None
+        return section_profile
+
+    def save_capture(self, name: str, capture_number: int, section_profile: cProfile.Profile):
+        try:
+            os.makedirs(self.capture_path, exist_ok=True)
+            file_prefix = os.path.join(self.capture_path, f"{capture_number:03d}-{name}")
+            section_profile.dump_stats(file_prefix + ".prof")
+            if tracemalloc.is_tracing():
+                tracemalloc.take_snapshot().dump(file_prefix + ".tracemalloc")
+            Utils.log(f"Profiler captured section[{name}] into [{file_prefix}.*].")
+        except Exception as e:
+            Utils.log_error(f"Profiler can't save capture of section[{name}].", e)
+
+    def finish_capture(self):
+        """Stop tracemalloc after the last capture."""
+        with self.lock:
+            if self.captures_left <= 0 and self.tracemalloc_started:
+                tracemalloc.stop()
+                self.tracemalloc_started = False
+
+    def get_records(self, name_prefix: str = "") -> List[ProfileRecord]:
+        return [record for record in list(self.records) if record.name.startswith(name_prefix)]
+
+    def summarize(self, name_prefix: str = "") -> List[ProfileSummary]:
+        records_by_name: Dict[str, List[ProfileRecord]] = dict()
+        for record in self.get_records(name_prefix):
+            records_by_name.setdefault(record.name, []).append(record)
+        summaries = []
+        for name, records in records_by_name.items():
+            count = len(records)
+            summaries.append(ProfileSummary(
+                name,
+                count,
+                sum(record.wall_seconds for record in records) / count,
+                max(record.wall_seconds for record in records),
+                sum(record.cpu_seconds for record in records) / count,
+                sum(record.allocated_blocks for record in records) / count
+            ))
+        return sorted(summaries, key=lambda summary: summary.mean_wall_seconds * summary.count, reverse=True)
+
+    def report(self, name_prefix: str = ""):
+        if not self.enabled:
+            return
+        for summary in self.summarize(name_prefix):
+            Utils.log(f"Profile[{summary.name}]: {summary.count} calls, "
+                      f"wall mean {summary.mean_wall_seconds * 1000:.1f}ms max {summary.max_wall_seconds * 1000:.1f}ms, "
+                      f"cpu mean {summary.mean_cpu_seconds * 1000:.1f}ms, "
+                      f"allocated blocks mean {summary.mean_allocated_blocks:.0f}.")
+
+    def start_periodic_report(self, interval_seconds: float = PROFILING_REPORT_INTERVAL_SECONDS):
+        """Report measurements every `interval_seconds` in background (for workers without their own schedule)."""
+        def report_periodically():
+            while True:
+                time.sleep(interval_seconds)
+                self.report()
+
+        report_thread = threading.Thread(target=report_periodically, daemon=True)
+        report_thread.start()
+
+
+def create_profiler_from_environment() -> Profiler:
+    """Profiler switched on by `PROFILING_ENABLED=1` environment variable. `PROFILING_CAPTURE_NEXT=N` additionally
+       captures the first N profiled sections."""
+    created_profiler = Profiler(enabled=os.environ.get(PROFILING_ENABLED_ENV_KEY, "0") == "1")
+    capture_next_count = int(os.environ.get(PROFILING_CAPTURE_NEXT_ENV_KEY, "0"))
+    if capture_next_count > 0:
+        created_profiler.capture_next(capture_next_count)
+    return created_profiler
+
+
+# Profiler shared by all the worker sections.
+profiler = create_profiler_from_environment()
+
+
+def profiled(name: Optional[str] = None):
+    """Decorator recording every call of the function with `profiler` under `name` (function name by default)."""
+    def decorator(function):
+        section_name = name if name is not None else function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.measure(section_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
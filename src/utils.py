@@ -1,10 +1,12 @@
 import datetime
+import threading
+import time
 from enum import Enum
+from typing import List, Optional, Tuple
 
-import requests
 import logging
 
-from src.configuration import LOGGING_FILE_PATH
+from src.configuration import LOGGING_FILE_PATH, MINUTES_INTERVAL
 
 class CustomLoggingLevel(Enum):
     Info = 1
@@ -23,6 +25,11 @@ class Utils:
     def get_date_truncated_by_minutes(date: datetime) -> datetime:
         return datetime.datetime(date.year, date.month, date.day, date.hour, date.minute)
 
+    @staticmethod
+    def get_minutes_interval_number(date: datetime) -> int:
+        """Get the interval (time X-axis mark) in which activity gathered at `date` is stored."""
+        return (date.hour * 60 + date.minute) // MINUTES_INTERVAL
+
     @staticmethod
     def get_date_truncated_by_day(date: datetime) -> datetime:
         return datetime.datetime(date.year, date.month, date.day)
@@ -57,5 +64,32 @@ class Utils:
 
     @staticmethod
     def count_words_at_url(url):
+        import requests
+
         resp = requests.get(url)
         return len(resp.text.split())
+
+
+class PhaseTimer:
+    """Measures time of consecutive phases of some work (e.g. worker startup). Phases may be marked from several
+       threads, so every phase stores both its own duration (since the previous mark) and the time since start."""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.last_mark_at = self.started_at
+        # List of (phase name, phase duration, time since start).
+        self.phases: List[Tuple[str, float, float]] = []
+        self.lock = threading.Lock()
+
+    def mark(self, phase_name: str):
+        """Finish the phase named `phase_name`."""
+        with self.lock:
+            now = time.perf_counter()
+            self.phases.append((phase_name, now - self.last_mark_at, now - self.started_at))
+            self.last_mark_at = now
+
+    def report(self, title: str):
+        with self.lock:
+            phases_info = ", ".join(f"{phase_name}: {duration * 1000:.0f}ms (at {since_start * 1000:.0f}ms)"
+                                    for phase_name, duration, since_start in self.phases)
+        Utils.log(f"{title} timing: {phases_info}.")
@@ -0,0 +1,190 @@
+import datetime
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.utils import Utils
+from src.vk.constants import ADAPTIVE_POLLING_ONLINE_PROBABILITY_THRESHOLD, ADAPTIVE_POLLING_RECENTLY_SEEN_SECONDS, \
+    ADAPTIVE_POLLING_MAX_SKIPPED_TICKS, ADAPTIVE_POLLING_BASELINE_EVERY_TICKS, ADAPTIVE_POLLING_PROFILES_MAX_AGE, \
+    ADAPTIVE_POLLING_PROFILES_RETRY_DELAY
+from src.vk.model import FollowerOnlineStatus
+
+
+@dataclass
+class FollowerPollingState:
+    """Last status of the follower received from Vk API."""
+    online: bool
+    # Unix time of `last_seen.time`.
+    last_seen_time: Optional[int]
+    platform: Optional[int]
+    last_polled_tick: int
+
+
+@dataclass
+class PollingPlan:
+    tick_number: int
+    polled_ids: List[int]
+    skipped_ids: List[int]
+    # Ids that would have been skipped on baseline tick (when all the followers are polled).
+    baseline_would_skip_ids: List[int]
+
+
+def datetime_to_unix_time(date: datetime.datetime) -> int:
+    # Datetimes of `last_seen` are stored in UTC (see `VkWorker.get_followers_current_online_status`).
+    return int(date.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+class AdaptivePollingPlanner:
+    """Decides whose online status has to be requested from Vk API on the current tick.
+       A follower is polled in case:
+       * he/she has never been polled or was online on the last poll;
+       * he/she was last seen recently;
+       * his/her historical probability to be online in the current weekday interval is high enough;
+       * he/she hasn't been polled for `max_skipped_ticks` ticks.
+       Statuses of the other followers are inferred as offline with the last known `last_seen`. Every
+       `baseline_every_ticks` tick everybody is polled, and the inferred statuses are checked against the real ones.
+       Historical probabilities are recalculated in background every `profiles_max_age` (see `start_profiles_refresh`),
+       failed recalculation is retried after `profiles_retry_delay` doubled with every failure in a row."""
+
+    def __init__(
+            self,
+            probability_threshold: float = ADAPTIVE_POLLING_ONLINE_PROBABILITY_THRESHOLD,
+            recently_seen_seconds: int = ADAPTIVE_POLLING_RECENTLY_SEEN_SECONDS,
+            max_skipped_ticks: int = ADAPTIVE_POLLING_MAX_SKIPPED_TICKS,
+            baseline_every_ticks: int = ADAPTIVE_POLLING_BASELINE_EVERY_TICKS,
+            profiles_max_age: datetime.timedelta = ADAPTIVE_POLLING_PROFILES_MAX_AGE,
+            profiles_retry_delay: datetime.timedelta = ADAPTIVE_POLLING_PROFILES_RETRY_DELAY
+    ):
+        self.probability_threshold = probability_threshold
+        self.recently_seen_seconds = recently_seen_seconds
+        self.max_skipped_ticks = max_skipped_ticks
+        self.baseline_every_ticks = baseline_every_ticks
+        self.profiles_max_age = profiles_max_age
+        self.profiles_retry_delay = profiles_retry_delay
+
+        self.tick_number = 0
+        self.states: Dict[int, FollowerPollingState] = dict()
+        # Online probabilities of shape (followers, weekdays, intervals)
+        # (see `ActivityMatrix.get_online_probability_profiles`).
+        self.profiles = None
+        self.profile_index: Dict[int, int] = dict()
+        self.profiles_updated_at: Optional[datetime.datetime] = None
+        # Profiles are replaced by the refreshing thread while ticks read them.
+        self.profiles_lock = threading.Lock()
+        self.profiles_refresh_started_at: Optional[datetime.datetime] = None
+        self.profiles_refresh_in_progress = False
+        self.profiles_refresh_failures = 0
+
+        # Statistics.
+        self.polled_total = 0
+        self.skipped_total = 0
+        self.baseline_checked_total = 0
+        self.baseline_mispredicted_total = 0
+
+    def set_activity_profiles(self, follower_ids, profiles, updated_at: datetime.datetime):
+        profile_index = {int(follower_id): index for index, follower_id in enumerate(follower_ids)}
+        with self.profiles_lock:
+            self.profiles = profiles
+            self.profile_index = profile_index
+            self.profiles_updated_at = updated_at
+
+    def needs_profiles_refresh(self, now: datetime.datetime) -> bool:
+        if self.profiles_refresh_in_progress:
+            return False
+        if self.profiles_refresh_started_at is None:
+            return True
+        if self.profiles_refresh_failures == 0:
+            delay = self.profiles_max_age
+        else:
+            delay = min(self.profiles_retry_delay * 2 ** (self.profiles_refresh_failures - 1), self.profiles_max_age)
+        return now - self.profiles_refresh_started_at >= delay
+
+    def start_profiles_refresh(self, now: datetime.datetime):
+        self.profiles_refresh_in_progress = True
+        self.profiles_refresh_started_at = now
+
+    def finish_profiles_refresh(self, succeeded: bool):
+        self.profiles_refresh_failures = 0 if succeeded else self.profiles_refresh_failures + 1
+        self.profiles_refresh_in_progress = False
+
+    def get_online_probability(self, follower_id: int, now: datetime.datetime) -> Optional[float]:
+        with self.profiles_lock:
+            if self.profiles is None or follower_id not in self.profile_index:
+                return None
+            minutes_interval_number = Utils.get_minutes_interval_number(now)
+            probability = float(self.profiles[self.profile_index[follower_id], now.weekday(), minutes_interval_number])
+        return None if math.isnan(probability) else probability
+
+    def should_poll(self, follower_id: int, now: datetime.datetime) -> bool:
+        state = self.states.get(follower_id)
+        if state is None or state.online:
+            return True
+        if self.tick_number - state.last_polled_tick >= self.max_skipped_ticks:
+            return True
+        if state.last_seen_time is None or time.time() - state.last_seen_time < self.recently_seen_seconds:
+            return True
+        probability = self.get_online_probability(follower_id, now)
+        return probability is not None and probability >= self.probability_threshold
+
+    def plan(self, follower_ids: List[int], now: datetime.datetime) -> PollingPlan:
+        self.tick_number += 1
+        polled_ids, skipped_ids = [], []
+        for follower_id in follower_ids:
+            if self.should_poll(follower_id, now):
+                polled_ids.append(follower_id)
+            else:
+                skipped_ids.append(follower_id)
+
+        if self.tick_number % self.baseline_every_ticks == 0:
+            return PollingPlan(self.tick_number, polled_ids + skipped_ids, [], skipped_ids)
+        return PollingPlan(self.tick_number, polled_ids, skipped_ids, [])
+
+    def record_statuses(self, plan: PollingPlan, statuses: List[FollowerOnlineStatus]):
+        """Remember polled statuses and update statistics."""
+        statuses_by_id = dict()
+        for status in statuses:
+            last_seen_time = datetime_to_unix_time(status.last_seen_datetime) \
+                if status.last_seen_datetime is not None else None
+            self.states[status.follower_id] = FollowerPollingState(
+                bool(status.online), last_seen_time, status.platform, plan.tick_number)
+            statuses_by_id[status.follower_id] = status
+
+        self.polled_total += len(plan.polled_ids)
+        self.skipped_total += len(plan.skipped_ids)
+        if plan.baseline_would_skip_ids:
+            mispredicted = sum(
+                1 for follower_id in plan.baseline_would_skip_ids
+                if follower_id in statuses_by_id and statuses_by_id[follower_id].online
+            )
+            self.baseline_checked_total += len(plan.baseline_would_skip_ids)
+            self.baseline_mispredicted_total += mispredicted
+            Utils.log(f"Adaptive polling baseline tick: {mispredicted} of {len(plan.baseline_would_skip_ids)} "
+                      f"followers that would have been skipped were online.")
+        Utils.log(f"Adaptive polling: polled {len(plan.polled_ids)}, skipped {len(plan.skipped_ids)} followers. "
+                  f"Total skipped share: {self.get_skipped_share():.1%}, "
+                  f"measured error: {self.get_measured_error():.1%}.")
+
+    def infer_status(
+            self,
+            follower_id: int,
+            minutes_interval_number: int,
+            current_datetime: datetime.datetime
+    ) -> FollowerOnlineStatus:
+        state = self.states[follower_id]
+        last_seen_datetime = datetime.datetime.utcfromtimestamp(state.last_seen_time) \
+            if state.last_seen_time is not None else None
+        return FollowerOnlineStatus(follower_id, minutes_interval_number, current_datetime, False,
+                                    last_seen_datetime, state.platform, inferred=True)
+
+    def get_skipped_share(self) -> float:
+        """Share of followers statuses that weren't requested from Vk API."""
+        total = self.polled_total + self.skipped_total
+        return self.skipped_total / total if total > 0 else 0.0
+
+    def get_measured_error(self) -> float:
+        """Share of followers that would have been inferred offline on baseline ticks while they were online."""
+        if self.baseline_checked_total == 0:
+            return 0.0
+        return self.baseline_mispredicted_total / self.baseline_checked_total
@@ -1,7 +1,11 @@
+import datetime
+
 # Bot communication.
 SECRET_MESSAGE_LINE_ASKING_FOR_PASSWORD = "Please, give me a password to show my activity info."
 SECRET_MESSAGE_LINE_ASKING_FOR_ACCOUNT_INFO = "Please, give me my account info."
 SECRET_MESSAGE_LINE_ASKING_TO_CHANGE_PUBLIC_STATUS = "Please, change my account publicity status."
+# * Name the bot calls follower by in case his/her profile can't be received from Vk API.
+UNKNOWN_FOLLOWER_NAME = "friend"
 
 # Worker configuration.
 # * In case we get `requests.error.ConnectionError` (e.g., because bot API timeout encountered as no events appeared
@@ -19,3 +23,47 @@ CONNECTION_ERROR_RESET_SECONDS_TIME_SLEEP = 10
 # * Amount of posts scanned from the top of community in order to build (user_id -> comment_id) map.
 #   As soon as we can't send private message, we respond users in comments.
 STARTUP_POSTS_READ_AMOUNT = 10
+
+# Startup timing (see `VkWorker.finish_startup_part`).
+# * Names of startup parts done in different threads. Startup timing is reported after both of them.
+LONG_POLL_CONNECTED_PHASE = "long poll connected"
+WARM_UP_FINISHED_PHASE = "warm up finished"
+
+# Forced replies scheduling.
+# * Time window during which like/unlike events of one follower are collected before the single (net) reply is sent.
+#   Each new event of the follower restarts the window.
+FORCED_REPLY_DEBOUNCE_SECONDS = 30
+
+# Bot messages handling.
+# * Private messages handling is switched off until the accounts collection is filled in the database again.
+PRIVATE_MESSAGES_HANDLING_ENABLED = False
+
+# Followers profiles caching.
+# * Time after which cached follower name is considered stale and is requested from Vk API again.
+FOLLOWER_PROFILE_CACHE_TTL_SECONDS = 24 * 60 * 60
+# * Maximum amount of profiles kept in memory. Least recently used profiles are evicted first.
+FOLLOWER_PROFILE_CACHE_MAX_SIZE = 10000
+# * Maximum amount of user ids Vk API accepts in one `users.get` call.
+USERS_GET_MAX_IDS_AMOUNT = 1000
+# * Maximum amount of members Vk API returns in one `groups.getMembers` call.
+GET_MEMBERS_MAX_AMOUNT = 1000
+
+# Adaptive polling of followers online status (see `AdaptivePollingPlanner`).
+# * Whether online status is requested only for followers that are likely to be online in the current interval.
+ADAPTIVE_POLLING_ENABLED = False
+# * Followers whose historical probability to be online in the current weekday interval is not less than this value
+#   are always polled.
+ADAPTIVE_POLLING_ONLINE_PROBABILITY_THRESHOLD = 0.05
+# * Followers that were last seen not earlier than this time ago are always polled.
+ADAPTIVE_POLLING_RECENTLY_SEEN_SECONDS = 30 * 60
+# * Skipped followers are still polled at least once in this amount of ticks.
+ADAPTIVE_POLLING_MAX_SKIPPED_TICKS = 5
+# * Every such tick all the followers are polled, and the statuses that would have been inferred are compared with
+#   the real ones to measure the error of adaptive polling.
+ADAPTIVE_POLLING_BASELINE_EVERY_TICKS = 30
+# * Amount of last days from which followers historical online probabilities are calculated.
+ADAPTIVE_POLLING_PROFILES_DAYS = 28
+# * Time after which historical online probabilities are recalculated.
+ADAPTIVE_POLLING_PROFILES_MAX_AGE = datetime.timedelta(days=1)
+# * Delay before the failed recalculation is retried. It is doubled after each failure in a row (up to max age).
+ADAPTIVE_POLLING_PROFILES_RETRY_DELAY = datetime.timedelta(minutes=10)
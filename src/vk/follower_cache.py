@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.utils import Utils
+from src.vk.constants import FOLLOWER_PROFILE_CACHE_TTL_SECONDS, FOLLOWER_PROFILE_CACHE_MAX_SIZE, \
+    USERS_GET_MAX_IDS_AMOUNT
+from src.vk.model import PublicFollowerInfo
+
+try:
+    import fcntl
+except ImportError:
+    # File locking is available on Unix only. Elsewhere the cache file is not shared by several processes anyway.
+    fcntl = None
+
+
+@dataclass
+class CachedFollowerProfile:
+    info: PublicFollowerInfo
+    # Unix time the profile was received from Vk API.
+    fetched_at: float
+
+
+@dataclass
+class InFlightFetch:
+    """Fetch of profiles that other threads may wait for."""
+    fetched_event: threading.Event
+    # Error the fetching thread failed with, it is raised in the waiting threads too.
+    error: Optional[BaseException] = None
+
+
+class FollowerProfileCache:
+    """LRU cache of followers profiles with entries expiring after `ttl_seconds`.
+       Misses are fetched in batches of at most `batch_size` ids through `fetch_function` (that is a wrapper over
+       `users.get`). In case several threads ask for the same missed id simultaneously, only one of them fetches it
+       and the others wait for the result (or get the same error if the fetch failed)."""
+
+    def __init__(
+            self,
+            fetch_function: Callable[[List[int]], List[PublicFollowerInfo]],
+            ttl_seconds: float = FOLLOWER_PROFILE_CACHE_TTL_SECONDS,
+            max_size: int = FOLLOWER_PROFILE_CACHE_MAX_SIZE,
+            batch_size: int = USERS_GET_MAX_IDS_AMOUNT,
+            persistence_path: Optional[str] = None
+    ):
+        self.fetch_function = fetch_function
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.persistence_path = persistence_path
+        self.lock = threading.Lock()
+        self.profiles: "OrderedDict[int, CachedFollowerProfile]" = OrderedDict()
+        # Map of (follower_id -> fetch) for ids that are being fetched right now by some thread.
+        self.in_flight_fetches: Dict[int, InFlightFetch] = dict()
+        if persistence_path is not None:
+            self.load()
+
+    def get(self, follower_id: int) -> Optional[PublicFollowerInfo]:
+        return self.get_many([follower_id]).get(follower_id)
+
+    def get_many(self, follower_ids: Iterable[int]) -> Dict[int, PublicFollowerInfo]:
+        """Get profiles of all the `follower_ids`. Only missed or stale profiles are requested from Vk API.
+           Ids unknown to Vk API are absent in the result."""
+        follower_ids = list(dict.fromkeys(follower_ids))
+        result = dict()
+        ids_to_fetch = []
+        ids_to_wait = dict()
+        in_flight_fetch = InFlightFetch(threading.Event())
+        with self.lock:
+            now = time.time()
+            for follower_id in follower_ids:
+                cached_profile = self.profiles.get(follower_id)
+                if cached_profile is not None and now - cached_profile.fetched_at < self.ttl_seconds:
+                    self.profiles.move_to_end(follower_id)
+                    result[follower_id] = cached_profile.info
+                elif follower_id in self.in_flight_fetches:
+                    ids_to_wait[follower_id] = self.in_flight_fetches[follower_id]
+                else:
+                    self.in_flight_fetches[follower_id] = in_flight_fetch
+                    ids_to_fetch.append(follower_id)
+
+        if ids_to_fetch:
+            result.update(self.fetch_batched(ids_to_fetch, in_flight_fetch))
+
+        for follower_id, waited_fetch in ids_to_wait.items():
+            waited_fetch.fetched_event.wait()
+            if waited_fetch.error is not None:
+                raise waited_fetch.error
+            with self.lock:
+                cached_profile = self.profiles.get(follower_id)
+            if cached_profile is not None:
+                result[follower_id] = cached_profile.info
+        return result
+
+    def fetch_batched(self, follower_ids: List[int], in_flight_fetch: InFlightFetch) -> Dict[int, PublicFollowerInfo]:
+        fetched = dict()
+        try:
+            for batch_start in range(0, len(follower_ids), self.batch_size):
+                batch = follower_ids[batch_start:batch_start + self.batch_size]
+                for follower_info in self.fetch_function(batch):
+                    fetched[follower_info.id] = follower_info
+            Utils.log(f"Fetched {len(fetched)} follower profiles.")
+        except BaseException as e:
+            in_flight_fetch.error = e
+            raise
+        finally:
+            with self.lock:
+                now = time.time()
+                for follower_id, follower_info in fetched.items():
+                    self.put_locked(follower_id, CachedFollowerProfile(follower_info, now))
+                for follower_id in follower_ids:
+                    self.in_flight_fetches.pop(follower_id, None)
+            in_flight_fetch.fetched_event.set()
+        return fetched
+
+    def put_locked(self, follower_id: int, cached_profile: CachedFollowerProfile):
+        self.profiles[follower_id] = cached_profile
+        self.profiles.move_to_end(follower_id)
+        while len(self.profiles) > self.max_size:
+            self.profiles.popitem(last=False)
+
+    def reserve(self, size: int):
+        """Grow `max_size` so that `size` profiles (e.g. the whole roster of the worker) fit into the cache at once.
+           Otherwise the profiles fetched for one tick evict each other and are fetched again every tick."""
+        with self.lock:
+            self.max_size = max(self.max_size, size)
+
+    def invalidate(self, follower_id: int):
+        with self.lock:
+            self.profiles.pop(follower_id, None)
+
+    def read_stored_profiles(self) -> Dict[str, list]:
+        """Profiles stored at `persistence_path` as (follower_id -> [first_name, last_name, fetched_at])."""
+        if not os.path.exists(self.persistence_path):
+            return dict()
+        try:
+            with open(self.persistence_path, 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError) as e:
+            Utils.log_error(f"Can't load follower profiles from [{self.persistence_path}].", e)
+            return dict()
+
+    def load(self):
+        """Fill the cache with profiles stored at `persistence_path` (expired ones are skipped)."""
+        if not os.path.exists(self.persistence_path):
+            return
+        stored_profiles = self.read_stored_profiles()
+        with self.lock:
+            now = time.time()
+            for follower_id, (first_name, last_name, fetched_at) in stored_profiles.items():
+                if now - fetched_at < self.ttl_seconds:
+                    follower_info = PublicFollowerInfo(int(follower_id), first_name, last_name)
+                    self.put_locked(int(follower_id), CachedFollowerProfile(follower_info, fetched_at))
+        Utils.log(f"Loaded {len(self.profiles)} follower profiles from [{self.persistence_path}].")
+
+    @contextmanager
+    def persistence_lock(self):
+        """Lock of the file at `persistence_path` shared by all processes, held while the file is read and rewritten."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.persistence_path + ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        """Store the cache at `persistence_path`. Profiles stored there by other processes (e.g. sharded pollers
+           caching different followers) are kept unless they expired."""
+        if self.persistence_path is None:
+            return
+        with self.persistence_lock():
+            now = time.time()
+            stored_profiles = {
+                follower_id: stored_profile for follower_id, stored_profile in self.read_stored_profiles().items()
+                if now - stored_profile[2] < self.ttl_seconds
+            }
+            with self.lock:
+                for follower_id, cached in self.profiles.items():
+                    stored_profile = stored_profiles.get(str(follower_id))
+                    if stored_profile is None or stored_profile[2] < cached.fetched_at:
+                        stored_profiles[str(follower_id)] = [cached.info.first_name, cached.info.last_name,
+                                                             cached.fetched_at]
+            temporary_path = f"{self.persistence_path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'w') as cache_file:
+                json.dump(stored_profiles, cache_file, ensure_ascii=False)
+            os.replace(temporary_path, self.persistence_path)
@@ -0,0 +1,123 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Pattern
+
+
+def normalize_message_text(text) -> str:
+    """Bring message text to the form in which it is matched against route phrases: lowercase with whitespaces
+       collapsed into single spaces."""
+    return " ".join(str(text).lower().split())
+
+
+def normalize_phrases(phrases: List[str]) -> List[str]:
+    normalized_phrases = [normalize_message_text(phrase) for phrase in phrases]
+    return [phrase for phrase in normalized_phrases if phrase]
+
+
+def get_phrase_pattern(phrase: str, prefix: bool = False) -> str:
+    """Regex of the phrase that matches whole words only (e.g. "hi" is not found in "this"). Prefix phrases (word stems,
+       e.g. "прив") match beginnings of words ("привет", "приветствую"). Phrase edges that are not word characters
+       (e.g. trailing ":") don't need boundaries."""
+    pattern = re.escape(phrase)
+    if re.match(r"\w", phrase):
+        pattern = r"(?<!\w)" + pattern
+    if not prefix and re.search(r"\w$", phrase):
+        pattern = pattern + r"(?!\w)"
+    return pattern
+
+
+@dataclass
+class RoutedMessage:
+    """Message passed to the route handler."""
+    follower_id: int
+    text: str
+    # Text after `normalize_message_text`.
+    normalized_text: str
+    event: object = None
+
+
+@dataclass
+class MessageRoute:
+    """Handler that is called when message contains one of the `phrases` (as whole words) or a word starting with one
+       of the `prefix_phrases`. In case message contains phrases of several routes, the route with the highest
+       `priority` is chosen (the earliest registered one in case of a tie)."""
+    name: str
+    phrases: List[str]
+    handler: Callable[[RoutedMessage], None]
+    priority: int = 0
+    # Index of the route in registration order.
+    order: int = field(default=0, compare=False)
+    prefix_phrases: List[str] = field(default_factory=list)
+
+
+class MessageRouter:
+    """Dispatcher of followers messages. All phrases of all routes are compiled into one regex, so that message text
+       is normalized once and scanned once regardless of the number of routes and phrases."""
+
+    def __init__(self):
+        self.routes: List[MessageRoute] = []
+        self.default_handler: Optional[Callable[[RoutedMessage], None]] = None
+        self.compiled_pattern: Optional[Pattern] = None
+
+    def add_route(
+            self,
+            name: str,
+            phrases: List[str],
+            handler: Callable[[RoutedMessage], None],
+            priority: int = 0,
+            prefix_phrases: Optional[List[str]] = None
+    ):
+        self.routes.append(MessageRoute(name, normalize_phrases(phrases), handler, priority, len(self.routes),
+                                        normalize_phrases(prefix_phrases or [])))
+        self.compiled_pattern = None
+
+    def route(self, name: str, phrases: List[str], priority: int = 0, prefix_phrases: Optional[List[str]] = None):
+        """Decorator version of `add_route`."""
+        def decorator(handler):
+            self.add_route(name, phrases, handler, priority, prefix_phrases)
+            return handler
+        return decorator
+
+    def set_default_handler(self, handler: Callable[[RoutedMessage], None]):
+        """Handler called when message doesn't contain any of the routes phrases."""
+        self.default_handler = handler
+
+    def compile(self) -> Pattern:
+        """Build the combined regex. Every route is a named group, groups are ordered by priority, so the first
+           matched group at a position is the most prioritized one. The whole alternation is wrapped into lookahead
+           so that overlapping phrases of different routes are all found in one pass."""
+        ordered_routes = sorted(self.routes, key=lambda route: (-route.priority, route.order))
+        alternatives = []
+        for route in ordered_routes:
+            phrases = [(phrase, False) for phrase in route.phrases] + [(phrase, True) for phrase in route.prefix_phrases]
+            if not phrases:
+                continue
+            # Longer phrases first so that the route is matched by its most specific phrase.
+            phrases.sort(key=lambda phrase: len(phrase[0]), reverse=True)
+            patterns = [get_phrase_pattern(phrase, prefix) for phrase, prefix in phrases]
+            alternatives.append(f"(?P<route_{route.order}>{'|'.join(patterns)})")
+        self.compiled_pattern = re.compile(f"(?=(?:{'|'.join(alternatives)}))") if alternatives else None
+        return self.compiled_pattern
+
+    def match(self, normalized_text: str) -> Optional[MessageRoute]:
+        """Find the most prioritized route whose phrase is contained in the `normalized_text`."""
+        if self.compiled_pattern is None and not self.compile():
+            return None
+        best_route = None
+        for match in self.compiled_pattern.finditer(normalized_text):
+            route = self.routes[int(match.lastgroup[len("route_"):])]
+            if best_route is None or (-route.priority, route.order) < (-best_route.priority, best_route.order):
+                best_route = route
+        return best_route
+
+    def dispatch(self, follower_id: int, text, event=None) -> Optional[str]:
+        """Call handler of the route matching the message. Returns name of the chosen route or None in case the
+           default handler was used."""
+        message = RoutedMessage(follower_id, str(text), normalize_message_text(text), event)
+        route = self.match(message.normalized_text)
+        if route is not None:
+            route.handler(message)
+            return route.name
+        if self.default_handler is not None:
+            self.default_handler(message)
+        return None
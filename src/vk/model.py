@@ -34,6 +34,8 @@ class FollowerOnlineStatus:
     online: bool
     last_seen_datetime: Optional[datetime.datetime] = None
     platform: Optional[int] = None
+    # Whether the status wasn't requested from Vk API but inferred (see `AdaptivePollingPlanner`).
+    inferred: bool = False
 
 
 @dataclass
@@ -0,0 +1,136 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from src.utils import Utils
+from src.vk.constants import FORCED_REPLY_DEBOUNCE_SECONDS
+
+# Texts of forced replies.
+REPLY_GREETING = "Привет! "
+REPLY_COMMENT_GREETING = "Привет! Я не могу ответить тебе в личных сообщениях, поэтому напишу здесь: "
+LIKE_ADDED_MESSAGE = "В сообществе G_b действует экспериментальный безлайковый режим. Убери, пожалуйста, лайк с поста."
+LIKE_ADDED_COMMENT_POSTSCRIPT = " Заранее спасибо! Я удалю комментарий, если ты уберёшь лайк."
+LIKE_REMOVED_MESSAGE = "Спасибо!"
+
+
+@dataclass
+class PendingFollowerReply:
+    """Like/unlike notices of one follower collected during the debounce window."""
+    follower_id: int
+    # Number of added likes minus number of removed likes.
+    likes_delta: int
+    timer: threading.Timer
+
+
+class ForcedReplyScheduler:
+    """Scheduler of forced replies to followers, which are sent even if they restricted community messages.
+       Instead of replying on every like/unlike event it waits `debounce_seconds` after the last event of the follower
+       and sends one reply that corresponds to the likes the follower still has (see `MongoWorker.likes`). When
+       the follower can't be replied in private messages, the bot keeps at most one comment for him/her: it is edited
+       on new likes and deleted as soon as all the likes are removed. The comment is stored in the follower document
+       of `likes` collection, so that it is deleted even after the worker restarts."""
+
+    def __init__(self, vk_worker, debounce_seconds: float = FORCED_REPLY_DEBOUNCE_SECONDS):
+        self.vk_worker = vk_worker
+        self.debounce_seconds = debounce_seconds
+        self.lock = threading.Lock()
+        self.pending_replies: Dict[int, PendingFollowerReply] = dict()
+
+    def schedule_like_added(self, follower_id: int):
+        self.schedule_likes_change(follower_id, 1)
+
+    def schedule_like_removed(self, follower_id: int):
+        self.schedule_likes_change(follower_id, -1)
+
+    def schedule_likes_change(self, follower_id: int, likes_delta: int):
+        """Add likes change into follower pending reply and restart its debounce window."""
+        with self.lock:
+            pending_reply = self.pending_replies.get(follower_id)
+            if pending_reply is not None:
+                pending_reply.timer.cancel()
+                likes_delta += pending_reply.likes_delta
+            timer = threading.Timer(self.debounce_seconds, self.flush_follower, args=[follower_id])
+            timer.daemon = True
+            self.pending_replies[follower_id] = PendingFollowerReply(follower_id, likes_delta, timer)
+            timer.start()
+
+    def flush_all(self):
+        """Immediately send all pending replies (e.g. before the worker stops)."""
+        with self.lock:
+            follower_ids = list(self.pending_replies.keys())
+        for follower_id in follower_ids:
+            self.flush_follower(follower_id)
+
+    def flush_follower(self, follower_id: int):
+        with self.lock:
+            pending_reply = self.pending_replies.pop(follower_id, None)
+        if pending_reply is None:
+            return
+        pending_reply.timer.cancel()
+
+        try:
+            # The window may cover only part of follower likes, so the reply depends on the likes that are left.
+            liked_posts_count = self.vk_worker.mongo_worker.get_user_liked_posts_count(follower_id)
+            if liked_posts_count > 0:
+                if pending_reply.likes_delta > 0:
+                    self.reply_like_added(follower_id)
+                else:
+                    Utils.log(f"Follower[{follower_id}] still likes {liked_posts_count} posts. Nothing to reply.")
+            elif pending_reply.likes_delta < 0 or \
+                    self.vk_worker.mongo_worker.get_user_bot_comment(follower_id) is not None:
+                self.reply_like_removed(follower_id)
+            else:
+                Utils.log(f"Likes of follower[{follower_id}] were added and removed back. Nothing to reply.")
+        except Exception as e:
+            Utils.log_error(f"Can't send scheduled reply to follower[{follower_id}].", e)
+
+    def reply_like_added(self, follower_id: int):
+        if self.try_reply_follower_message(follower_id, REPLY_GREETING + LIKE_ADDED_MESSAGE):
+            return
+        comment_message = REPLY_COMMENT_GREETING + LIKE_ADDED_MESSAGE + LIKE_ADDED_COMMENT_POSTSCRIPT
+        mongo_worker = self.vk_worker.mongo_worker
+        bot_comment = mongo_worker.get_user_bot_comment(follower_id)
+        if bot_comment is not None:
+            _, bot_comment_id = bot_comment
+            if self.vk_worker.edit_wall_post_comment(bot_comment_id, comment_message):
+                return
+            if not self.vk_worker.is_wall_post_comment_deleted(bot_comment_id):
+                # The comment is still there (or we don't know), so we don't leave one more.
+                Utils.log(f"Kept comment[{bot_comment_id}] for follower[{follower_id}] as it is.")
+                return
+            # Comment was deleted by somebody else, so we create it again.
+            mongo_worker.remove_user_bot_comment(follower_id)
+
+        follower_comment = self.get_follower_comment(follower_id)
+        if follower_comment is None:
+            Utils.log(f"Can't forcefully reply user[{follower_id}] in comments, because he is not in the map.")
+            return
+        post_id, comment_id = follower_comment
+        bot_comment_id = self.vk_worker.reply_wall_post_comment(post_id, comment_id, comment_message)
+        if bot_comment_id is not None:
+            mongo_worker.set_user_bot_comment(follower_id, post_id, bot_comment_id)
+
+    def reply_like_removed(self, follower_id: int):
+        mongo_worker = self.vk_worker.mongo_worker
+        bot_comment = mongo_worker.get_user_bot_comment(follower_id)
+        if bot_comment is not None:
+            # We promised to delete the comment instead of leaving one more comment with gratitude.
+            _, bot_comment_id = bot_comment
+            if self.vk_worker.delete_wall_post_comment(bot_comment_id) or \
+                    self.vk_worker.is_wall_post_comment_deleted(bot_comment_id):
+                mongo_worker.remove_user_bot_comment(follower_id)
+            return
+        self.try_reply_follower_message(follower_id, REPLY_GREETING + LIKE_REMOVED_MESSAGE)
+
+    def try_reply_follower_message(self, follower_id: int, message: str) -> bool:
+        """Reply follower in private messages unless we already know he/she restricted messages from community."""
+        if follower_id in self.vk_worker.messages_restricted_follower_ids:
+            return False
+        return self.vk_worker.reply_follower_message(follower_id, message)
+
+    def get_follower_comment(self, follower_id: int) -> Optional[tuple]:
+        follower_comments = self.vk_worker.get_user_comments(follower_id)
+        if not follower_comments:
+            return None
+        # Reply to the latest comment so that the follower is more likely to notice it.
+        return max(follower_comments)
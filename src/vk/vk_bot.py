@@ -1,32 +1,36 @@
 import json
-import logging
 import time
-from dataclasses import dataclass
-from typing import List
+from functools import cached_property
+from typing import List, Optional
 
 import datetime
-import requests
-import vk_api
-from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
-from vk_api.keyboard import VkKeyboard, VkKeyboardColor
-from vk_api.longpoll import VkLongPoll, VkEventType
-from vk_api.utils import get_random_id
 import threading
 
 from re import search
 
-from src.configuration import *
+# Note that `vk_api` (and `requests` it is built on) is imported only when it is needed for the first time, so that
+# the bot starts quickly (see `VkWorker.start_work`).
+from src.configuration import VK_CONFIG_PATH, COMMUNITY_ACCESS_TOKEN_KEY, SERVICE_TOKEN_KEY, GROUP_ID_KEY, \
+    TRACKED_COMMUNITY_IDS_KEY, VK_API_VERSION, FOLLOWER_PROFILE_CACHE_PATH, ACTIVITY_EXPORT_PATH
 from src.db.mongo_worker import MongoWorker
-from src.utils import Utils, CustomLoggingLevel
+from src.profiling import profiled
+from src.utils import Utils, CustomLoggingLevel, PhaseTimer
 from src.vk.constants import SECRET_MESSAGE_LINE_ASKING_FOR_PASSWORD, SECRET_MESSAGE_LINE_ASKING_FOR_ACCOUNT_INFO, \
     SECRET_MESSAGE_LINE_ASKING_TO_CHANGE_PUBLIC_STATUS, CONNECTION_ERROR_TIMEOUT_WAIT_SECONDS, \
     CONNECTION_ERROR_RETRIES_THRESHOLD, CONNECTION_ERROR_RESET_SECONDS_TIME_SLEEP, \
-    CONNECTION_ERROR_RESET_SECONDS_NEEDED, STARTUP_POSTS_READ_AMOUNT
+    CONNECTION_ERROR_RESET_SECONDS_NEEDED, STARTUP_POSTS_READ_AMOUNT, PRIVATE_MESSAGES_HANDLING_ENABLED, \
+    ADAPTIVE_POLLING_ENABLED, ADAPTIVE_POLLING_PROFILES_DAYS, GET_MEMBERS_MAX_AMOUNT, \
+    USERS_GET_MAX_IDS_AMOUNT, UNKNOWN_FOLLOWER_NAME, LONG_POLL_CONNECTED_PHASE, WARM_UP_FINISHED_PHASE
+from src.vk.adaptive_polling import AdaptivePollingPlanner
+from src.vk.follower_cache import FollowerProfileCache
+from src.vk.message_router import MessageRouter, RoutedMessage
+from src.vk.reply_scheduler import ForcedReplyScheduler
 from src.vk.model import PublicFollowerInfo, PrivateFollowerInfo, FollowerOnlineStatus, CommunityPost, \
-    CommunityPostComment
+    CommunityPostComment, BotMessage
 
 # Constants for recognizing followers messages.
 greetings = ['hi', 'hello', 'welcome', 'good morning', 'good afternoon', 'good evening']
+# Russian greetings are word stems, e.g. 'прив' matches both "привет" and "приветик".
 russian_greetings = ['прив', 'даров', 'добрый день', 'добрый вечер', 'добрая ночь', 'хай']
 
 # Constants for accessing fields from Vk API responses.
@@ -56,21 +60,19 @@ class VkWorker:
         Utils.log("Bot started initialization")
         with open(VK_CONFIG_PATH, 'r') as vk_config:
             config_data = json.load(vk_config)
-            community_access_token = config_data[COMMUNITY_ACCESS_TOKEN_KEY]
-            service_token = config_data[SERVICE_TOKEN_KEY]
+            self.community_access_token = config_data[COMMUNITY_ACCESS_TOKEN_KEY]
+            self.service_token = config_data[SERVICE_TOKEN_KEY]
             group_id = config_data[GROUP_ID_KEY]
+            # Communities whose members activity is tracked. The bot community is tracked by default.
+            tracked_community_ids = config_data.get(TRACKED_COMMUNITY_IDS_KEY, [group_id])
 
         # ================ VK API configuration ===============================
         self.group_id = int(group_id)
-        # This api is used for interacting with community API as an admin through community access token.
-        self.vk_community_session = vk_api.VkApi(token=community_access_token)
-        self.vk_community_api = self.vk_community_session.get_api()
-        # This api is used for interacting with community API as a random follower (e.g., when we need to access
-        # community wall posts).
-        self.vk_service_session = vk_api.VkApi(token=service_token)
-        self.vk_service_api = self.vk_service_session.get_api()
+        self.tracked_community_ids = [int(community_id) for community_id in tracked_community_ids]
+        # Vk API sessions are created on first use (see `vk_community_session` and `vk_service_session`).
 
         # ================ MongoDB configuration ===============================
+        # Connection to the database is established on first query.
         self.mongo_worker = MongoWorker()
 
         # ================ Worker util logic configuration ===============================
@@ -80,9 +82,45 @@ class VkWorker:
         # Dirty workaround over impossibility to send message to user, who blocked messages from community.
         # We store a map of (user_if -> {(post_id, comment_id)}) so that we can reply them in comments.
         self.user_id_to_comment_ids_map = dict()
+        # The map is filled in background while events are already handled.
+        self.user_id_to_comment_ids_map_lock = threading.Lock()
+        # Followers that restricted messages from community. We don't try to send them private messages until they
+        # allow them again (see `handle_message_allow`).
+        self.messages_restricted_follower_ids = set()
+        self.reply_scheduler = ForcedReplyScheduler(self)
+        # Cache of followers profiles so that handling a message or a tick doesn't cost extra `users.get` calls.
+        self.follower_profile_cache = FollowerProfileCache(self.fetch_followers_info,
+                                                           persistence_path=FOLLOWER_PROFILE_CACHE_PATH)
+        self.private_message_router = self.build_private_message_router()
+        self.adaptive_polling_planner = AdaptivePollingPlanner()
+        self.startup_timer: Optional[PhaseTimer] = None
+        # Parts of startup done by different threads. Startup timing is reported once all of them are finished.
+        self.pending_startup_parts = {LONG_POLL_CONNECTED_PHASE, WARM_UP_FINISHED_PHASE}
+        self.pending_startup_parts_lock = threading.Lock()
 
         Utils.log("Bot finished initialization")
 
+    @cached_property
+    def vk_community_session(self):
+        """Session used for interacting with community API as an admin through community access token."""
+        import vk_api
+        return vk_api.VkApi(token=self.community_access_token)
+
+    @cached_property
+    def vk_community_api(self):
+        return self.vk_community_session.get_api()
+
+    @cached_property
+    def vk_service_session(self):
+        """Session used for interacting with community API as a random follower (e.g., when we need to access
+           community wall posts)."""
+        import vk_api
+        return vk_api.VkApi(token=self.service_token)
+
+    @cached_property
+    def vk_service_api(self):
+        return self.vk_service_session.get_api()
+
     def get_owner_id(self):
         """Get id of group as owner."""
         # Note that this value must be negative (negative values correspond to community ids).
@@ -91,6 +129,8 @@ class VkWorker:
     def requests_read_timeout_wrapper(self, function):
         """Function-workaround that ignores bot timeout.
            Bot timeout results from bot inactivity (not receiving messages from any user)."""
+        import requests
+
         while True:
             try:
                 function()
@@ -125,52 +165,118 @@ class VkWorker:
         for post in posts:
             post_id = post.id
             for comment in post.comments:
-                comment_author_id = comment.from_id
-                comment_id = comment.id
-                post_comment_pair = (post_id, comment_id)
-                if comment.from_id in self.user_id_to_comment_ids_map:
-                    self.user_id_to_comment_ids_map[comment_author_id].add(post_comment_pair)
-                else:
-                    self.user_id_to_comment_ids_map[comment_author_id] = { post_comment_pair }
+                self.add_user_comment(comment.from_id, post_id, comment.id)
         Utils.log("Bot finished filling map.")
 
+    def add_user_comment(self, user_id: int, post_id: int, comment_id: int):
+        post_comment_pair = (post_id, comment_id)
+        with self.user_id_to_comment_ids_map_lock:
+            if user_id in self.user_id_to_comment_ids_map:
+                self.user_id_to_comment_ids_map[user_id].add(post_comment_pair)
+            else:
+                self.user_id_to_comment_ids_map[user_id] = { post_comment_pair }
 
-    def start_work(self):
-        """Function that starts Bot for receiving and handling events."""
-        self.fill_user_id_to_comment_ids_map()
+    def get_user_comments(self, user_id: int) -> List[tuple]:
+        """Get (post_id, comment_id) pairs of the user comments known to the bot."""
+        with self.user_id_to_comment_ids_map_lock:
+            return list(self.user_id_to_comment_ids_map.get(user_id, set()))
 
-        connection_errors_resetter_thread = threading.Thread(target=self.connection_error_threshold_tracker)
-        connection_errors_resetter_thread.start()
+    def warm_up(self):
+        """Work that is not needed to start handling events, but makes handling faster or more complete."""
+        try:
+            self.fill_user_id_to_comment_ids_map()
+            self.mark_startup_phase("comments map filled")
+            self.get_all_followers_info()
+            self.mark_startup_phase("followers profiles cached")
+        except Exception as e:
+            Utils.log_error("Bot failed to warm up.", e)
+        self.finish_startup_part(WARM_UP_FINISHED_PHASE)
+
+    def mark_startup_phase(self, phase_name: str):
+        if self.startup_timer is not None:
+            self.startup_timer.mark(phase_name)
+
+    def finish_startup_part(self, part_name: str):
+        """Mark the part of startup (see `pending_startup_parts`) and report startup timing after the last one.
+           Parts finished once again (e.g. long poll reconnection) are ignored."""
+        with self.pending_startup_parts_lock:
+            if part_name not in self.pending_startup_parts:
+                return
+            self.pending_startup_parts.remove(part_name)
+            self.mark_startup_phase(part_name)
+            startup_finished = not self.pending_startup_parts
+        if startup_finished and self.startup_timer is not None:
+            self.startup_timer.report("Bot startup")
+
+    def start_work(self, startup_timer: Optional[PhaseTimer] = None):
+        """Function that starts Bot for receiving and handling events. Events are listened right away, while the
+           comments map and followers profiles are filled in background."""
+        self.startup_timer = startup_timer
+        # Sessions are created before the threads using them start, as `cached_property` doesn't guarantee that
+        # a property accessed by several threads at once is created only once.
+        _ = self.vk_community_api, self.vk_service_api
+        self.mark_startup_phase("sessions created")
 
         events_listener_thread = threading.Thread(target=self.requests_read_timeout_wrapper, args=[self.listen_events])
         events_listener_thread.start()
 
+        connection_errors_resetter_thread = threading.Thread(target=self.connection_error_threshold_tracker)
+        connection_errors_resetter_thread.start()
+
+        warm_up_thread = threading.Thread(target=self.warm_up, daemon=True)
+        warm_up_thread.start()
+
+        self.mark_startup_phase("threads started")
         Utils.log("Bot started working.")
 
+    def stop(self):
+        """Send pending forced replies before the worker process stops."""
+        self.reply_scheduler.flush_all()
+        Utils.log("Bot stopped working.")
+
     def get_long_poll_server_info(self):
         """Get information about long poll server (key, server, ts)."""
         return self.vk_community_api.groups.getLongPollServer(group_id=self.group_id, v=VK_API_VERSION)
 
-    def get_follower_info_by_id(self, follower_id) -> PublicFollowerInfo:
-        """Get information about concrete follower."""
-        follower_info = self.vk_community_api.users.get(user_id=follower_id, v=VK_API_VERSION)[0]
-        first_name, last_name = follower_info[first_name_key], follower_info[last_name_key]
-        return PublicFollowerInfo(follower_id, first_name, last_name)
+    def get_follower_info_by_id(self, follower_id) -> Optional[PublicFollowerInfo]:
+        """Get information about concrete follower (None in case Vk API doesn't know him/her)."""
+        return self.follower_profile_cache.get(follower_id)
 
-    def get_all_followers_info(self) -> List[PublicFollowerInfo]:
-        """Get information about all community followers"""
-        follower_ids = self.vk_community_api.groups.getMembers(group_id=self.group_id, v=VK_API_VERSION)[items_key]
-        print(f"Followers ids: {follower_ids}")
+    def fetch_followers_info(self, follower_ids: List[int]) -> List[PublicFollowerInfo]:
+        """Get information about followers from Vk API bypassing the cache.
+           Note that `follower_ids` amount mustn't exceed `USERS_GET_MAX_IDS_AMOUNT`."""
         followers_info = self.vk_community_api.users.get(user_ids=follower_ids, v=VK_API_VERSION)
         followers_info_formatted = []
-        print(f"Followers info: {followers_info}")
         for follower_info in followers_info:
-            print(f"Follower info unforamtted: {follower_info}")
             follower_id, first_name, last_name = follower_info[id_key], follower_info[first_name_key], follower_info[
                 last_name_key]
             followers_info_formatted.append(PublicFollowerInfo(follower_id, first_name, last_name))
         return followers_info_formatted
 
+    def get_community_member_ids(self, community_id: int) -> List[int]:
+        """Get ids of all the community members (`groups.getMembers` returns at most 1000 members per call)."""
+        member_ids = []
+        while True:
+            members_info = self.vk_community_api.groups.getMembers(
+                group_id=community_id,
+                offset=len(member_ids),
+                count=GET_MEMBERS_MAX_AMOUNT,
+                v=VK_API_VERSION)
+            member_ids.extend(members_info[items_key])
+            if len(members_info[items_key]) == 0 or len(member_ids) >= members_info["count"]:
+                return member_ids
+
+    @profiled("vk.fetch_followers_info")
+    def get_all_followers_info(self) -> List[PublicFollowerInfo]:
+        """Get information about all community followers"""
+        follower_ids = self.get_community_member_ids(self.group_id)
+        Utils.log(f"Community has {len(follower_ids)} followers.")
+        # Only new or stale profiles are requested from Vk API.
+        self.follower_profile_cache.reserve(len(follower_ids))
+        followers_info = self.follower_profile_cache.get_many(follower_ids)
+        self.follower_profile_cache.save()
+        return [followers_info[follower_id] for follower_id in follower_ids if follower_id in followers_info]
+
     def get_community_post_comments(
             self,
             from_id: int,
@@ -233,6 +339,71 @@ class VkWorker:
             current_offset += step
         return all_posts
 
+    @profiled("tick.fetch_online_status")
+    def get_followers_online_status(self, followers_info: List[PublicFollowerInfo]) -> List[FollowerOnlineStatus]:
+        """Get online statuses of the followers for the current interval either polling all of them or only the
+           ones chosen by `adaptive_polling_planner`."""
+        if ADAPTIVE_POLLING_ENABLED:
+            return self.get_followers_adaptive_online_status(followers_info)
+        return self.get_followers_current_online_status(followers_info)
+
+    def get_followers_adaptive_online_status(
+            self,
+            followers_info: List[PublicFollowerInfo]
+    ) -> List[FollowerOnlineStatus]:
+        """Poll only followers that are likely to be online, statuses of the others are inferred."""
+        current_datetime = Utils.get_date_truncated_by_minutes(datetime.datetime.now())
+        follower_ids = [follower_info.id for follower_info in followers_info]
+        if self.adaptive_polling_planner.needs_profiles_refresh(current_datetime):
+            self.start_adaptive_polling_profiles_refresh(current_datetime, follower_ids)
+
+        plan = self.adaptive_polling_planner.plan(follower_ids, current_datetime)
+        polled_ids = set(plan.polled_ids)
+        polled_followers_info = [follower_info for follower_info in followers_info if follower_info.id in polled_ids]
+        follower_online_statuses = self.get_followers_current_online_status(polled_followers_info) \
+            if polled_followers_info else []
+        self.adaptive_polling_planner.record_statuses(plan, follower_online_statuses)
+
+        current_minutes_interval = Utils.get_minutes_interval_number(current_datetime)
+        for follower_id in plan.skipped_ids:
+            follower_online_statuses.append(
+                self.adaptive_polling_planner.infer_status(follower_id, current_minutes_interval, current_datetime))
+        return follower_online_statuses
+
+    def start_adaptive_polling_profiles_refresh(self, current_datetime: datetime.datetime, follower_ids: List[int]):
+        """Recalculate profiles in background so that the tick isn't delayed. Meanwhile the planner uses the previous
+           profiles (or relies on `last_seen` only)."""
+        self.adaptive_polling_planner.start_profiles_refresh(current_datetime)
+        refresh_thread = threading.Thread(target=self.refresh_adaptive_polling_profiles,
+                                          args=[current_datetime, follower_ids], daemon=True)
+        refresh_thread.start()
+
+    def refresh_adaptive_polling_profiles(self, current_datetime: datetime.datetime, follower_ids: List[int]):
+        """Recalculate historical online probabilities of the polled followers used by `adaptive_polling_planner`.
+           They are calculated from the day export of activity (see `ActivityExporter`) instead of scanning
+           `activity_data` collection. Days of the range that aren't exported yet are exported first."""
+        # Analytics depends on NumPy, which is needed only in case adaptive polling is enabled.
+        from src.analytics.activity_matrix import ActivityMatrix
+        from src.db.activity_export import ActivityExporter
+
+        end = Utils.get_date_truncated_by_day(current_datetime)
+        start = end - datetime.timedelta(days=ADAPTIVE_POLLING_PROFILES_DAYS)
+        try:
+            exporter = ActivityExporter(self.mongo_worker, ACTIVITY_EXPORT_PATH)
+            exporter.export(start, end)
+            activity_matrix = ActivityMatrix.from_export(exporter, start, end, follower_ids)
+            if not activity_matrix.observed.any():
+                raise ValueError(f"No activity of the followers is exported into [{exporter.export_path}].")
+            self.adaptive_polling_planner.set_activity_profiles(
+                activity_matrix.follower_ids, activity_matrix.get_online_probability_profiles(), current_datetime)
+            self.adaptive_polling_planner.finish_profiles_refresh(True)
+            Utils.log(f"Refreshed adaptive polling profiles of {len(activity_matrix.follower_ids)} followers "
+                      f"from [{exporter.export_path}].")
+        except Exception as e:
+            # Without profiles the planner relies on `last_seen` only until the retry.
+            self.adaptive_polling_planner.finish_profiles_refresh(False)
+            Utils.log_error("Can't refresh adaptive polling profiles.", e)
+
     def get_followers_current_online_status(self, followers_info: List[PublicFollowerInfo]):
         """Get information about all the followers indicating whether they are currently online or not. In case they are
            online, get the information about which platform they use Vk from."""
@@ -240,12 +411,16 @@ class VkWorker:
 
         follower_online_statuses = []
         follower_ids = [follower_info.id for follower_info in followers_info]
-        follower_infos = self.vk_community_api.users.get(user_ids=follower_ids, fields=f"{online_key},{last_seen_key}",
-                                                         v=VK_API_VERSION)
+        follower_infos = []
+        # Members of several communities may not fit into one `users.get` call.
+        for batch_start in range(0, len(follower_ids), USERS_GET_MAX_IDS_AMOUNT):
+            follower_infos.extend(self.vk_community_api.users.get(
+                user_ids=follower_ids[batch_start:batch_start + USERS_GET_MAX_IDS_AMOUNT],
+                fields=f"{online_key},{last_seen_key}",
+                v=VK_API_VERSION))
 
         # Calculate the interval (time X-axis mark) in which we should store activity information.
-        current_minutes_interval = (
-                                           current_datetime.time().hour * 60 + current_datetime.time().minute) // MINUTES_INTERVAL
+        current_minutes_interval = Utils.get_minutes_interval_number(current_datetime)
 
         for follower_info in follower_infos:
             follower_id = follower_info[id_key]
@@ -274,6 +449,9 @@ class VkWorker:
     def reply_follower_message(self, follower_id: int, message: str) -> bool:
         """Helper function-wrapper over API for replying to followers messages.
            Returns True in case reply went successfully and False otherwise."""
+        from vk_api.exceptions import VkApiError
+        from vk_api.utils import get_random_id
+
         errors_prefix = f"Can't send reply[{message}] to follower[{follower_id}]. "
 
         try:
@@ -284,8 +462,9 @@ class VkWorker:
             )
             Utils.log(f"Bot replied to follower[{follower_id}] with [{message}].")
             return True
-        except vk_api.exceptions.VkApiError as vk_api_e:
+        except VkApiError as vk_api_e:
             if search("Can't send messages for users without permission", str(vk_api_e)):
+                self.messages_restricted_follower_ids.add(follower_id)
                 Utils.log_error(errors_prefix + "User restricted messages from community.", vk_api_e)
             else:
                 Utils.log_error(errors_prefix + "Unknown VkApiError error.", vk_api_e)
@@ -294,77 +473,136 @@ class VkWorker:
 
         return False
 
-    def reply_wall_post_comment(self, post_id: int, comment_id: int, message: str):
-        """Helper function-wrapper over API for replying to post comments."""
+    def reply_wall_post_comment(self, post_id: int, comment_id: int, message: str) -> Optional[int]:
+        """Helper function-wrapper over API for replying to post comments.
+           Returns id of the created comment in case reply went successfully and None otherwise."""
+        from vk_api.exceptions import VkApiError
+
         errors_prefix = f"Can't reply comment[{comment_id}] on post[{post_id}] wih message[{message}]. "
 
         try:
-            self.vk_community_api.wall.createComment(
+            created_comment_info = self.vk_community_api.wall.createComment(
                 owner_id=self.get_owner_id(),
                 post_id=post_id,
                 reply_to_comment=comment_id,
                 message=message
             )
             Utils.log(f"Bot replied to comment[{comment_id}] on post[{post_id}] with message[{message}].")
-        except vk_api.exceptions.VkApiError as vk_api_e:
+            return created_comment_info["comment_id"]
+        except VkApiError as vk_api_e:
             Utils.log_error(errors_prefix + "Unknown VkApiError error.", vk_api_e)
         except Exception as e:
             Utils.log_error(errors_prefix + "Unknown error.", e)
 
-    def forced_reply_follower(self, follower_id: int, message: str):
-        """Method executed when we aggressively want to send a message to user. Even if he/she blocked
-        community messages."""
-        # TODO: In case follower likes many posts he will spam in comments with our forced replies.
-        #       Even in case he removes a like, he will born two comments that will stay as spam.
-        #       Proposal:
-        #       1)    Like -> span (add) comment.
-        #       1.1)  Comment: ... + "Заранее спасибо! Я удалю комментарий, если ты уберёшь лайк",
-        #             чтобы потом не приходилось плодить ещё один комментарий только ради "Спасибо!".
-        #       2)    One more like -> delete previous comment and create one again (user will get new notification).
-        #       3)    Like deleted -> delete comment.
-        message_reply_result = self.reply_follower_message(follower_id, "Привет! " + message)
-        if not message_reply_result:
-            # For some reason we didn't succeed to reply user in private message.
-            if follower_id in self.user_id_to_comment_ids_map:
-                follower_set = self.user_id_to_comment_ids_map[follower_id]
-                post_id, comment_id = list(follower_set)[0]
-                self.reply_wall_post_comment(
-                    post_id,
-                    comment_id,
-                    "Привет! Я не могу ответить тебе в личных сообщениях, поэтому напишу здесь: " + message
-                )
-            else:
-                Utils.log(f"Can't forcefully reply[{message}] user[{follower_id}] in comments, because he is not in the map.")
+        return None
+
+    def edit_wall_post_comment(self, comment_id: int, message: str) -> bool:
+        """Helper function-wrapper over API for editing bot comments.
+           Returns True in case edit went successfully and False otherwise."""
+        from vk_api.exceptions import VkApiError
+
+        errors_prefix = f"Can't edit comment[{comment_id}] with message[{message}]. "
 
+        try:
+            self.vk_community_api.wall.editComment(
+                owner_id=self.get_owner_id(),
+                comment_id=comment_id,
+                message=message
+            )
+            Utils.log(f"Bot edited comment[{comment_id}] with message[{message}].")
+            return True
+        except VkApiError as vk_api_e:
+            Utils.log_error(errors_prefix + "Unknown VkApiError error.", vk_api_e)
+        except Exception as e:
+            Utils.log_error(errors_prefix + "Unknown error.", e)
+
+        return False
+
+    def delete_wall_post_comment(self, comment_id: int) -> bool:
+        """Helper function-wrapper over API for deleting bot comments.
+           Returns True in case deletion went successfully and False otherwise."""
+        from vk_api.exceptions import VkApiError
+
+        errors_prefix = f"Can't delete comment[{comment_id}]. "
+
+        try:
+            self.vk_community_api.wall.deleteComment(
+                owner_id=self.get_owner_id(),
+                comment_id=comment_id
+            )
+            Utils.log(f"Bot deleted comment[{comment_id}].")
+            return True
+        except VkApiError as vk_api_e:
+            Utils.log_error(errors_prefix + "Unknown VkApiError error.", vk_api_e)
+        except Exception as e:
+            Utils.log_error(errors_prefix + "Unknown error.", e)
+
+        return False
+
+    def is_wall_post_comment_deleted(self, comment_id: int) -> Optional[bool]:
+        """Whether the comment doesn't exist anymore. Returns None in case it can't be checked (e.g. on network
+           errors)."""
+        from vk_api.exceptions import ApiError, VkApiError
+
+        errors_prefix = f"Can't check comment[{comment_id}]. "
+
+        try:
+            comment_info = self.vk_community_api.wall.getComment(
+                owner_id=self.get_owner_id(),
+                comment_id=comment_id
+            )
+            items = comment_info.get("items", [])
+            return not items or bool(items[0].get("deleted", False))
+        except ApiError as api_e:
+            # Vk API reports comments that don't exist as invalid `comment_id` parameter.
+            if api_e.code == 100:
+                return True
+            Utils.log_error(errors_prefix + "Unknown ApiError error.", api_e)
+        except VkApiError as vk_api_e:
+            Utils.log_error(errors_prefix + "Unknown VkApiError error.", vk_api_e)
+        except Exception as e:
+            Utils.log_error(errors_prefix + "Unknown error.", e)
+
+        return None
+
+    @profiled("event.handle_like_add")
     def handle_like_add(self, event):
         if event.object["object_type"] == "post":
             follower_id = event.object["liker_id"]
             added = self.mongo_worker.add_user_liked_post(follower_id, event.object["object_id"])
             if added:
-                self.forced_reply_follower(
-                    follower_id,
-                    "В сообществе G_b действует экспериментальный безлайковый режим."
-                    "Убери, пожалуйста, лайк с поста."
-                )
+                self.reply_scheduler.schedule_like_added(follower_id)
 
+    @profiled("event.handle_like_remove")
     def handle_like_remove(self, event):
         if event.object["object_type"] == "post":
             follower_id = event.object["liker_id"]
             removed = self.mongo_worker.remove_user_liked_post(follower_id, event.object["object_id"])
             if removed:
-                self.forced_reply_follower(
-                    follower_id,
-                    "Спасибо!"
-                )
+                self.reply_scheduler.schedule_like_removed(follower_id)
 
+    @profiled("event.handle_message_allow")
+    def handle_message_allow(self, event):
+        """Logic of handling follower allowing messages from community."""
+        follower_id = event.object["user_id"]
+        self.messages_restricted_follower_ids.discard(follower_id)
+
+    @profiled("event.handle_message_deny")
+    def handle_message_deny(self, event):
+        """Logic of handling follower restricting messages from community."""
+        follower_id = event.object["user_id"]
+        self.messages_restricted_follower_ids.add(follower_id)
+
+    @profiled("event.handle_message_new")
     def handle_message_new(self, event):
-        return
         if event.from_chat:
             # Message came from shared community chat.
             return
 
             def reply_message(chat_id: int, message: str):
                 """Some legacy logic (maybe specific for community shared chat)."""
+                from vk_api.utils import get_random_id
+
                 self.vk_community_api.messages.send(
                     # key=LONG_POLL_KEY,
                     # server=LONG_POLL_SERVER,
@@ -378,7 +616,8 @@ class VkWorker:
             follower_id = event.message["from_id"]
             text = event.message["text"]
             attachments = event.message["attachments"]
-            follower_name = self.get_follower_info_by_id(follower_id).first_name
+            follower_info = self.get_follower_info_by_id(follower_id)
+            follower_name = follower_info.first_name if follower_info is not None else UNKNOWN_FOLLOWER_NAME
 
             if SECRET_MESSAGE_LINE_ASKING_FOR_PASSWORD in str(text):
                 reply_message(event.chat_id,
@@ -390,33 +629,50 @@ class VkWorker:
                               f"{follower_name}, anybody wants to listen to your stupid audio_message!")
             elif any_from_list_in_value(text, [*greetings, *russian_greetings]):
                 reply_message(event.chat_id, f"Hello, {follower_name}!")
-        elif event.to_me and event.from_user:
-            # Message came from shared community chat.
-            return
-            message_sending_user_id = event.user_id
-            message_sending_user_name = self.get_follower_info_by_id(message_sending_user_id)
-
-            self.reply_follower_message(event.user_id, f"Hi! You are {message_sending_user_name}")
-            if SECRET_MESSAGE_LINE_ASKING_FOR_PASSWORD in str(event.text):
-                secret = self.mongo_worker.get_user_secret_key_by_id(event.user_id)
-                reply_follower_message(event.user_id, f"Here's your password, {message_sending_user_name}: {secret}")
-            elif SECRET_MESSAGE_LINE_ASKING_FOR_ACCOUNT_INFO in str(event.text):
-                follower_id = event.user_id
-                surname = self.mongo_worker.get_user_surname_by_id(follower_id)
-                reply_follower_message(event.user_id,
-                                       f"Here's your account info:\nId: {follower_id}\nSurname: {surname}")
-            elif SECRET_MESSAGE_LINE_ASKING_TO_CHANGE_PUBLIC_STATUS in str(event.text):
-                follower_id = event.user_id
-                new_publicity_status = self.mongo_worker.change_follower_publicity_status(follower_id)
-                reply_follower_message(event.user_id,
-                                       f"Your account publicity status changed to {new_publicity_status}")
-            elif any_from_list_in_value(event.text, [*greetings, *russian_greetings]):
-                reply_follower_message(event.user_id, f"Hi, {message_sending_user_name}! :)")
-            else:
-                reply_follower_message(event.user_id,
-                                       f"I'm sorry, {message_sending_user_name}. I don't understand such command yet")
-                self.mongo_worker.insert_bot_message(BotMessageInfo(event.user_id, event.text))
-
+        elif event.from_user:
+            if not PRIVATE_MESSAGES_HANDLING_ENABLED:
+                return
+            self.private_message_router.dispatch(event.message["from_id"], event.message["text"], event)
+
+    def build_private_message_router(self) -> MessageRouter:
+        """Register handlers of private messages sent to the bot."""
+        router = MessageRouter()
+
+        def get_follower_name(message: RoutedMessage) -> str:
+            follower_info = self.get_follower_info_by_id(message.follower_id)
+            return follower_info.first_name if follower_info is not None else UNKNOWN_FOLLOWER_NAME
+
+        @router.route("password", [SECRET_MESSAGE_LINE_ASKING_FOR_PASSWORD], priority=30)
+        def reply_password(message: RoutedMessage):
+            secret = self.mongo_worker.get_user_secret_key_by_id(message.follower_id)
+            self.reply_follower_message(message.follower_id,
+                                        f"Here's your password, {get_follower_name(message)}: {secret}")
+
+        @router.route("account_info", [SECRET_MESSAGE_LINE_ASKING_FOR_ACCOUNT_INFO], priority=20)
+        def reply_account_info(message: RoutedMessage):
+            surname = self.mongo_worker.get_user_surname_by_id(message.follower_id)
+            self.reply_follower_message(message.follower_id,
+                                        f"Here's your account info:\nId: {message.follower_id}\nSurname: {surname}")
+
+        @router.route("change_public_status", [SECRET_MESSAGE_LINE_ASKING_TO_CHANGE_PUBLIC_STATUS], priority=10)
+        def reply_public_status_change(message: RoutedMessage):
+            new_publicity_status = self.mongo_worker.change_follower_publicity_status(message.follower_id)
+            self.reply_follower_message(message.follower_id,
+                                        f"Your account publicity status changed to {new_publicity_status}")
+
+        @router.route("greeting", greetings, prefix_phrases=russian_greetings)
+        def reply_greeting(message: RoutedMessage):
+            self.reply_follower_message(message.follower_id, f"Hi, {get_follower_name(message)}! :)")
+
+        def reply_unknown_command(message: RoutedMessage):
+            self.reply_follower_message(message.follower_id,
+                                        f"I'm sorry, {get_follower_name(message)}. I don't understand such command yet")
+            self.mongo_worker.insert_bot_message(BotMessage(message.follower_id, message.text))
+
+        router.set_default_handler(reply_unknown_command)
+        return router
+
+    @profiled("event.handle_wall_reply_new")
     def handle_wall_reply_new(self, event):
         """Logic of handling new comments appearance."""
         event_object = event.object
@@ -424,13 +680,9 @@ class VkWorker:
         post_id = event_object["post_id"]
         from_id = event_object["from_id"]
 
-        post_comment_pair = (post_id, comment_id)
-
-        if from_id in self.user_id_to_comment_ids_map:
-            self.user_id_to_comment_ids_map[from_id].add(post_comment_pair)
-        else:
-            self.user_id_to_comment_ids_map[from_id] = { post_comment_pair }
+        self.add_user_comment(from_id, post_id, comment_id)
 
+    @profiled("event.handle_wall_reply_delete")
     def handle_wall_reply_delete(self, event):
         """Logic of handling comments deletion."""
         event_object = event.object
@@ -440,17 +692,19 @@ class VkWorker:
 
         post_comment_pair = (post_id, comment_id)
 
-        if deleter_id in self.user_id_to_comment_ids_map:
-            deleter_set = self.user_id_to_comment_ids_map[deleter_id]
-            if post_comment_pair in deleter_set:
-                self.user_id_to_comment_ids_map[deleter_id].remove(post_comment_pair)
+        with self.user_id_to_comment_ids_map_lock:
+            if deleter_id in self.user_id_to_comment_ids_map:
+                self.user_id_to_comment_ids_map[deleter_id].discard(post_comment_pair)
 
     def listen_events(self):
         """Process all events coming from VK server."""
         # TODO: Currently if we take an event from longpoll queue, but fail to handle it (e.g. when Exception is raised),
         #       we miss the event. I propose to add such events in a queue (e.g. RabbitMQ or Redis) and send an
         #       acknowledge message only in case of successful logic execution.
+        from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
+
         longpoll = VkBotLongPoll(self.vk_community_session, self.group_id)
+        self.finish_startup_part(LONG_POLL_CONNECTED_PHASE)
         Utils.log("Started listening events")
         for event in longpoll.listen():
             Utils.log(f"Event appeared: {event}")
@@ -460,6 +714,10 @@ class VkWorker:
                 self.handle_like_remove(event)
             elif event.type == VkBotEventType.MESSAGE_NEW:
                 self.handle_message_new(event)
+            elif event.type == VkBotEventType.MESSAGE_ALLOW:
+                self.handle_message_allow(event)
+            elif event.type == VkBotEventType.MESSAGE_DENY:
+                self.handle_message_deny(event)
             elif event.type == VkBotEventType.WALL_REPLY_NEW:
                 self.handle_wall_reply_new(event)
             elif event.type == VkBotEventType.WALL_REPLY_DELETE:
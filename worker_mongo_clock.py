@@ -5,6 +5,7 @@ from apscheduler.triggers.interval import IntervalTrigger
 
 from src.configuration import MINUTES_INTERVAL
 from src.db.mongo_worker import MongoWorker
+from src.profiling import profiler
 
 sched = BlockingScheduler()
 
@@ -12,6 +13,7 @@ sched = BlockingScheduler()
 @sched.scheduled_job(IntervalTrigger(minutes=MINUTES_INTERVAL))
 def timed_job():
     MongoWorker().made_interval_activity_filling_action()
+    profiler.report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+
+from src.configuration import MINUTES_INTERVAL, SHARDED_WORKERS_NUMBER
+from src.db.sharded_poller import ShardedActivityPoller
+from src.profiling import profiler
+from src.utils import Utils
+from src.vk.vk_bot import VkWorker
+
+
+def run_poller(worker_id: str):
+    vk_worker = VkWorker()
+    poller = ShardedActivityPoller(worker_id, vk_worker, vk_worker.mongo_worker)
+
+    def timed_job():
+        poller.made_interval_activity_filling_action()
+        profiler.report()
+
+    sched = BlockingScheduler()
+    sched.add_job(timed_job, IntervalTrigger(minutes=MINUTES_INTERVAL))
+
+    def stop_scheduler(signal_number, frame):
+        # Scheduler stops and the lease is released right away, so that other workers take over the followers
+        # without waiting for the lease to expire.
+        sched.shutdown(wait=False)
+
+    signal.signal(signal.SIGTERM, stop_scheduler)
+    Utils.log(f"Worker[{worker_id}] started polling.")
+    try:
+        sched.start()
+    finally:
+        poller.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll activity of tracked communities members in several processes. "
+                                                 "Processes of all the running deployments share the work.")
+    parser.add_argument("--processes", type=int, default=SHARDED_WORKERS_NUMBER,
+                        help="Amount of polling processes started by this deployment.")
+    args = parser.parse_args()
+
+    worker_id_prefix = f"{socket.gethostname()}-{os.getpid()}"
+    processes = [
+        multiprocessing.Process(target=run_poller, args=[f"{worker_id_prefix}-{process_number}"])
+        for process_number in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
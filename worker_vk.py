@@ -1,11 +1,36 @@
-from src.utils import Utils
+import time
+
+# Startup time is measured from the very beginning, including the imports.
+STARTED_AT = time.perf_counter()
+
+import os
+import signal
+import threading
+
+from src.profiling import profiler
+from src.utils import Utils, PhaseTimer
 from src.vk.vk_bot import VkWorker
 
 if __name__ == "__main__":
+    startup_timer = PhaseTimer(STARTED_AT)
+    startup_timer.mark("imports")
     Utils.init()
     try:
         vk_worker = VkWorker()
-        vk_worker.start_work()
+        startup_timer.mark("initialization")
+
+        def stop_worker(signal_number, frame):
+            vk_worker.stop()
+            # Events listener threads never finish by themselves.
+            os._exit(0)
+
+        signal.signal(signal.SIGTERM, stop_worker)
+        signal.signal(signal.SIGINT, stop_worker)
+        vk_worker.start_work(startup_timer)
+        if profiler.enabled:
+            profiler.start_periodic_report()
     except Exception as e:
         Utils.log_error("HIGH_LEVEL_ERROR_HANDLING", e)
         raise e
+    # Signals are handled by the main thread only, so it waits for them instead of finishing.
+    threading.Event().wait()